@@ -1,13 +1,17 @@
 from pydantic import BaseModel
 from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from typing import List
+from typing import List, Optional
 from datetime import date, datetime
 
 
-from app.database import get_session  # импорт асинхронной сессии
+from app import audit
+from app.api.fields import parse_fields, sparse_response
+from app.database import get_session, get_read_session  # импорт асинхронной сессии
 from app.models import Action, Employee, ActionType
+from app.services import update_overtime_rollup, invalidate_overtime_cache
 from app.api.employee import add_hours, EmployeeAddHours
 
 class ActionCreate(BaseModel):
@@ -27,6 +31,15 @@ class ActionResponse(BaseModel):
         from_attributes = True
 
 
+# Поля списка действий для параметра fields=
+ACTION_FIELDS = {
+    "action_id": Action.action_id,
+    "hours": Action.hours,
+    "date_action": Action.date_action,
+    "employee_id": Action.employee_id,
+    "actiontype_id": Action.actiontype_id,
+}
+
 router = APIRouter(prefix="/actions", tags=["actions"])
 
 
@@ -37,7 +50,7 @@ async def create_action(action: ActionCreate, db: AsyncSession = Depends(get_ses
     """
     try:
         # Проверка существование сотрудника
-        employee_result = await db.execute(select(Employee).where(Employee.employee_id == action.employee_id))
+        employee_result = await db.execute(select(Employee).where(Employee.employee_id == action.employee_id, Employee.deleted_at.is_(None)))
         existing_employee = employee_result.scalars().first()
         if not existing_employee:
             raise HTTPException(status_code=400, detail="Сотрудника с таким id не существует")
@@ -53,33 +66,57 @@ async def create_action(action: ActionCreate, db: AsyncSession = Depends(get_ses
                             employee_id = action.employee_id,
                             actiontype_id = action.actiontype_id)
         db.add(db_action)
-        existing_employee.idle_hours += action.hours
+        # Атомарное начисление часов, как при удалении действия
+        result = await db.execute(
+            update(Employee)
+            .where(Employee.employee_id == action.employee_id, Employee.deleted_at.is_(None))
+            .values(idle_hours=Employee.idle_hours + action.hours)
+            .returning(Employee.idle_hours)
+            .execution_options(synchronize_session=False)
+        )
+        idle_hours = result.scalar_one_or_none()
+        if idle_hours is None:
+            # Сотрудника удалили после проверки выше - не оставляем действие без сотрудника
+            raise HTTPException(status_code=400, detail="Сотрудника с таким id не существует")
+        audit.record(db, "employee", action.employee_id, "update",
+                     {"idle_hours": (idle_hours - action.hours, idle_hours)})
+        await update_overtime_rollup(db, [db_action])
         await db.commit()
+        invalidate_overtime_cache([action.employee_id])
         await db.refresh(db_action)
 
         return db_action
 
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
         await db.rollback()
         raise HTTPException(status_code=500, detail=f"Ошибка при создании действия: {str(e)}")
 
 
 @router.get("/all", response_model=List[ActionResponse])
-async def get_all_actions(db: AsyncSession = Depends(get_session)):
+async def get_all_actions(fields: Optional[str] = None, db: AsyncSession = Depends(get_read_session)):
     """
-    Получение всех действий
+    Получение всех действий (fields= - только перечисленные поля)
     """
-    result = await db.execute(select(Action))
-    actions = result.scalars().all()
-    return actions
+    names = parse_fields(fields, ACTION_FIELDS)
+    result = await db.execute(
+        select(*[ACTION_FIELDS[name] for name in names]).where(Action.deleted_at.is_(None))
+    )
+
+    if fields:
+        return sparse_response(result.all(), names)
+
+    return [ActionResponse(**row._mapping) for row in result.all()]
 
 
 @router.get("/{action_id}", response_model=ActionResponse)
-async def get_actions(action_id: int, db: AsyncSession = Depends(get_session)):
+async def get_actions(action_id: int, db: AsyncSession = Depends(get_read_session)):
     """
     Получение типа дейсвия  по ID
     """
-    result = await db.execute(select(Action).where(Action.action_id == action_id))
+    result = await db.execute(select(Action).where(Action.action_id == action_id, Action.deleted_at.is_(None)))
     action = result.scalar_one_or_none()
 
     if not action:
@@ -107,14 +144,33 @@ async def get_actions(action_id: int, db: AsyncSession = Depends(get_session)):
 @router.delete("/{action_id}")
 async def delete_action(action_id: int, db: AsyncSession = Depends(get_session)):
     """
-    Удаление должности
+    Удаление действия (мягкое) с возвратом его часов из остатка сотрудника
     """
-    result = await db.execute(select(Action).where(Action.action_id == action_id))
-    action = result.scalar_one_or_none()
-
-    if not action:
+    deleted_at = datetime.now()
+    result = await db.execute(
+        update(Action)
+        .where(Action.action_id == action_id, Action.deleted_at.is_(None))
+        .values(deleted_at=deleted_at)
+        .returning(Action.employee_id, Action.hours, Action.date_action, Action.actiontype_id)
+        .execution_options(synchronize_session=False)
+    )
+    deleted = result.first()
+
+    if not deleted:
         raise HTTPException(status_code=404, detail="Действие не найдено")
 
-    await db.delete(action)
+    # Атомарная корректировка остатка без загрузки сотрудника
+    result = await db.execute(
+        update(Employee)
+        .where(Employee.employee_id == deleted.employee_id)
+        .values(idle_hours=Employee.idle_hours - deleted.hours)
+        .returning(Employee.idle_hours)
+        .execution_options(synchronize_session=False)
+    )
+    idle_hours = result.scalar_one()
+    await update_overtime_rollup(db, [deleted], sign=-1)
+    audit.record(db, "action", action_id, "delete", {"deleted_at": (None, deleted_at)})
+    audit.record(db, "employee", deleted.employee_id, "update", {"idle_hours": (idle_hours + deleted.hours, idle_hours)})
     await db.commit()
+    invalidate_overtime_cache([deleted.employee_id])
     return {"message": "Действие успешно удалено"}
\ No newline at end of file
@@ -0,0 +1,62 @@
+import json
+from pydantic import BaseModel
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from typing import List, Optional
+from datetime import datetime
+
+from app.database import get_read_session
+from app.models import AuditLog
+from app.audit import audit_writer
+
+class AuditLogResponse(BaseModel):
+    audit_id: int
+    created_at: datetime
+    table_name: str
+    entity_id: Optional[int]
+    operation: str
+    employee_id: Optional[int]
+    changes: dict
+
+
+router = APIRouter(prefix="/audit", tags=["audit"])
+
+
+@router.get("/all", response_model=List[AuditLogResponse])
+async def get_audit_log(
+        table_name: Optional[str] = None,
+        entity_id: Optional[int] = None,
+        employee_id: Optional[int] = None,
+        limit: int = Query(100, ge=1, le=1000),
+        offset: int = Query(0, ge=0),
+        db: AsyncSession = Depends(get_read_session)
+):
+    """
+    Постраничное получение журнала аудита (новые записи первыми)
+    """
+    # Сбрасываем буфер, чтобы в выдачу попали уже закоммиченные изменения
+    await audit_writer.flush()
+
+    query = select(AuditLog)
+    if table_name is not None:
+        query = query.where(AuditLog.table_name == table_name)
+    if entity_id is not None:
+        query = query.where(AuditLog.entity_id == entity_id)
+    if employee_id is not None:
+        query = query.where(AuditLog.employee_id == employee_id)
+
+    result = await db.execute(query.order_by(AuditLog.audit_id.desc()).limit(limit).offset(offset))
+
+    return [
+        AuditLogResponse(
+            audit_id=entry.audit_id,
+            created_at=entry.created_at,
+            table_name=entry.table_name,
+            entity_id=entry.entity_id,
+            operation=entry.operation,
+            employee_id=entry.employee_id,
+            changes=json.loads(entry.changes)
+        )
+        for entry in result.scalars().all()
+    ]
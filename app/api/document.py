@@ -1,11 +1,17 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import Response
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
+from sqlalchemy import case, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
 from datetime import datetime, date
-import io
-import tempfile
-import os
-from fastapi.responses import FileResponse
+from typing import Dict, List, Optional
+
+from app.database import get_read_session
+from app.models import Employee, Otdel, Post, Action, ActionType, OvertimeMonthly
+from app.services import refresh_work_calendar
+from app.templates import template_registry, FORMATS, TemplateError
+from app.workcalendar import work_calendar, WORKING, WEEKEND, HOLIDAY
 
 
 router = APIRouter(prefix="/documents", tags=["documents"])
@@ -18,88 +24,206 @@ class HolidayDocumentRequest(BaseModel):
     holiday_date: str
 
 
+class DocumentParams(BaseModel):
+    """
+    Параметры генерации документа; какие из них обязательны, зависит от шаблона
+    """
+    employee_id: Optional[int] = None
+    otdel_id: Optional[int] = None
+    year: Optional[int] = None
+    month: Optional[int] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    holiday_date: Optional[date] = None
+
+
+class DocumentTemplatesResponse(BaseModel):
+    templates: Dict[str, List[str]]
+
+
+DAY_CLASS_NAMES = {WORKING: "рабочий", WEEKEND: "выходной", HOLIDAY: "праздничный"}
+MONTH_NAMES = ["январь", "февраль", "март", "апрель", "май", "июнь",
+               "июль", "август", "сентябрь", "октябрь", "ноябрь", "декабрь"]
+
+
+def _require(params: DocumentParams, *names: str):
+    missing = [name for name in names if getattr(params, name) is None]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Для документа нужны параметры: {', '.join(missing)}")
+
+
+async def _employee_header(db: AsyncSession, employee_id: int):
+    result = await db.execute(
+        select(Employee.employee_id, Employee.surname, Employee.name, Employee.patronymic,
+               Employee.idle_hours, Otdel.name_otdel, Post.name_post)
+        .join(Otdel, Employee.otdel_id == Otdel.otdel_id)
+        .join(Post, Employee.post_id == Post.post_id)
+        .where(Employee.employee_id == employee_id, Employee.deleted_at.is_(None))
+    )
+    employee = result.first()
+    if employee is None:
+        raise HTTPException(status_code=404, detail="Такой сотрудник не найден")
+    return employee
+
+
+async def _active_otdel(db: AsyncSession, otdel_id: int):
+    result = await db.execute(
+        select(Otdel.otdel_id, Otdel.name_otdel).where(Otdel.otdel_id == otdel_id, Otdel.deleted_at.is_(None))
+    )
+    otdel = result.first()
+    if otdel is None:
+        raise HTTPException(status_code=404, detail="Отдел не найден")
+    return otdel
+
+
+async def holiday_context(db: AsyncSession, params: DocumentParams) -> dict:
+    """
+    Справка о выходном дне сотрудника
+    """
+    _require(params, "employee_id", "holiday_date")
+    employee = await _employee_header(db, params.employee_id)
+    return {
+        "surname": employee.surname,
+        "name": employee.name,
+        "patronymic": employee.patronymic,
+        "holiday_date": params.holiday_date,
+        "current_date": datetime.now(),
+    }
+
+
+async def overtime_order_context(db: AsyncSession, params: DocumentParams) -> dict:
+    """
+    Приказ о привлечении к сверхурочной работе: действия сотрудника за период
+    """
+    _require(params, "employee_id", "date_from", "date_to")
+    refresh_work_calendar()
+    employee = await _employee_header(db, params.employee_id)
+    result = await db.execute(
+        select(Action.date_action, Action.hours, ActionType.name_type)
+        .join(ActionType, Action.actiontype_id == ActionType.actiontype_id)
+        .where(
+            Action.employee_id == params.employee_id,
+            Action.deleted_at.is_(None),
+            Action.date_action >= params.date_from,
+            Action.date_action <= params.date_to
+        )
+        .order_by(Action.date_action, Action.action_id)
+    )
+
+    rows, total_hours = [], 0
+    for row in result.all():
+        rows.append({
+            "date_action": row.date_action,
+            "day_class": DAY_CLASS_NAMES[work_calendar.day_class(row.date_action)],
+            "name_type": row.name_type,
+            "hours": row.hours,
+        })
+        total_hours += row.hours
+
+    return {
+        "employee": employee,
+        "date_from": params.date_from,
+        "date_to": params.date_to,
+        "rows": rows,
+        "total_hours": total_hours,
+        "current_date": datetime.now(),
+    }
+
+
+async def timesheet_context(db: AsyncSession, params: DocumentParams) -> dict:
+    """
+    Табель отдела за месяц из помесячной сводки (Переработка - тип 2, Выходной - тип 1)
+    """
+    _require(params, "otdel_id", "year", "month")
+    if not 1 <= params.month <= 12:
+        raise HTTPException(status_code=400, detail="Месяц должен быть от 1 до 12")
+    otdel = await _active_otdel(db, params.otdel_id)
+
+    overtime_hours = func.coalesce(func.sum(case((OvertimeMonthly.actiontype_id == 2, OvertimeMonthly.hours), else_=0)), 0)
+    dayoff_hours = func.coalesce(func.sum(case((OvertimeMonthly.actiontype_id == 1, OvertimeMonthly.hours), else_=0)), 0)
+    result = await db.execute(
+        select(Employee.employee_id, Employee.surname, Employee.name, Employee.patronymic, Employee.idle_hours,
+               Post.name_post, overtime_hours.label("overtime_hours"), dayoff_hours.label("dayoff_hours"))
+        .join(Post, Employee.post_id == Post.post_id)
+        .outerjoin(OvertimeMonthly, (OvertimeMonthly.employee_id == Employee.employee_id)
+                   & (OvertimeMonthly.year == params.year) & (OvertimeMonthly.month == params.month))
+        .where(Employee.otdel_id == params.otdel_id, Employee.deleted_at.is_(None))
+        .group_by(Employee.employee_id)
+        .order_by(Employee.surname, Employee.name, Employee.employee_id)
+    )
+
+    rows, total_overtime, total_dayoff = [], 0, 0
+    for number, row in enumerate(result.all(), start=1):
+        rows.append({**row._mapping, "number": number})
+        total_overtime += row.overtime_hours
+        total_dayoff += row.dayoff_hours
+
+    return {
+        "otdel": otdel,
+        "period": f"{MONTH_NAMES[params.month - 1]} {params.year}",
+        "rows": rows,
+        "total_overtime": total_overtime,
+        "total_dayoff": total_dayoff,
+        "current_date": datetime.now(),
+    }
+
+
+async def balance_context(db: AsyncSession, params: DocumentParams) -> dict:
+    """
+    Ведомость остатков часов сотрудников (по отделу или по всем)
+    """
+    query = (
+        select(Employee.surname, Employee.name, Employee.patronymic, Employee.idle_hours,
+               Otdel.name_otdel, Post.name_post)
+        .join(Otdel, Employee.otdel_id == Otdel.otdel_id)
+        .join(Post, Employee.post_id == Post.post_id)
+        .where(Employee.deleted_at.is_(None))
+        .order_by(Otdel.name_otdel, Employee.surname, Employee.name, Employee.employee_id)
+    )
+    title = "по всем отделам"
+    if params.otdel_id is not None:
+        otdel = await _active_otdel(db, params.otdel_id)
+        query = query.where(Employee.otdel_id == params.otdel_id)
+        title = f"отдел: {otdel.name_otdel}"
+
+    result = await db.execute(query)
+    rows, total_hours = [], 0
+    for number, row in enumerate(result.all(), start=1):
+        rows.append({**row._mapping, "number": number})
+        total_hours += row.idle_hours
+
+    return {"title": title, "rows": rows, "total_hours": total_hours, "current_date": datetime.now()}
+
 
-DOCUMENT_TEMPLATE = """
-<html xmlns:o='urn:schemas-microsoft-com:office:office' 
-      xmlns:w='urn:schemas-microsoft-com:office:word' 
-      xmlns='http://www.w3.org/TR/REC-html40'>
-<head>
-    <meta charset='utf-8'>
-    <title>Справка о выходном дне</title>
-    <style>
-        body { font-family: 'Times New Roman'; font-size: 14pt; margin: 1in; }
-        .header { text-align: center; font-weight: bold; font-size: 16pt; margin-bottom: 20pt; }
-        .subheader { text-align: center; font-size: 14pt; margin-bottom: 30pt; }
-        .section { margin-bottom: 15pt; text-align: justify; line-height: 1.5; }
-        .employee-info { margin: 20pt 0; }
-        .employee-info table { border-collapse: collapse; }
-        .employee-info td { padding: 5pt 10pt; vertical-align: top; }
-        .signature { margin-top: 50pt; text-align: right; }
-    </style>
-</head>
-<body>
-    <div class='header'>СПРАВКА</div>
-    <div class='subheader'>о предоставлении выходного дня</div>
-
-    <div class='section'>
-        Настоящая справка подтверждает, что сотруднику:
-    </div>
-
-    <div class='employee-info'>
-        <table>
-            <tr><td><b>Фамилия:</b></td><td>{{surname}}</td></tr>
-            <tr><td><b>Имя:</b></td><td>{{name}}</td></tr>
-            <tr><td><b>Отчество:</b></td><td>{{patronymic}}</td></tr>
-        </table>
-    </div>
-
-    <div class='section'>
-        на основании приказа руководства предоставлен дополнительный
-        выходной день <b>{{holiday_date}}</b>.
-    </div>
-
-    <div class='section'>
-        Выходной день предоставляется в счет переработки рабочих часов
-        и не подлежит денежной компенсации.
-    </div>
-
-    <div class='section'>
-        Справка выдана для предъявления по месту требования.
-    </div>
-
-    <div class='signature'>
-        <div>Дата выдачи справки: <b>{{current_date}}</b></div>
-        <div style='margin-top: 50pt;'>_________________________</div>
-        <div>М.П.</div>
-    </div>
-</body>
-</html>
-"""
+# Шаблон -> функция, собирающая данные для него из БД
+DOCUMENT_SOURCES = {
+    "holiday": holiday_context,
+    "overtime_order": overtime_order_context,
+    "timesheet": timesheet_context,
+    "balance": balance_context,
+}
 
 
 def generate_holiday_document(surname: str, name: str, patronymic: str, holiday_date: str) -> str:
     """
-    Генерация документа с заменой переменных в шаблоне
+    Генерация справки о выходном дне по шаблону holiday
     """
     try:
         # Парсим дату
         holiday_dt = datetime.strptime(holiday_date, "%Y-%m-%d")
-        current_date = datetime.now()
-
-        # Замена переменных в шаблоне
-        document = DOCUMENT_TEMPLATE \
-            .replace("{{surname}}", surname) \
-            .replace("{{name}}", name) \
-            .replace("{{patronymic}}", patronymic) \
-            .replace("{{holiday_date}}", holiday_dt.strftime("%d.%m.%Y")) \
-            .replace("{{current_date}}", current_date.strftime("%d.%m.%Y"))
-
-        return document
-
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"Неверный формат даты: {str(e)}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка при генерации документа: {str(e)}")
+
+    template = template_registry.get("holiday", "doc")
+    if template is None:
+        raise HTTPException(status_code=500, detail="Шаблон справки не найден")
+    return "".join(template.render({
+        "surname": surname,
+        "name": name,
+        "patronymic": patronymic,
+        "holiday_date": holiday_dt,
+        "current_date": datetime.now(),
+    }))
 
 
 @router.post("/holiday")
@@ -107,31 +231,60 @@ async def create_holiday_document(request: HolidayDocumentRequest):
     """
     Создание справки о выходном дне
     """
-    temp_path = None
-    try:
-        # Генерируем документ
-        document_content = generate_holiday_document(
-            surname=request.surname,
-            name=request.name,
-            patronymic=request.patronymic,
-            holiday_date=request.holiday_date
-        )
+    document_content = generate_holiday_document(
+        surname=request.surname,
+        name=request.name,
+        patronymic=request.patronymic,
+        holiday_date=request.holiday_date
+    )
+    filename = f"holiday_document_{datetime.now().strftime('%Y%m%d%H%M%S')}.doc"
 
-        # Создаем временный файл с UTF-8 кодировкой
-        with tempfile.NamedTemporaryFile(mode='w', encoding='utf-8', suffix='.doc', delete=False) as f:
-            f.write(document_content)
-            temp_path = f.name
+    return Response(
+        content=document_content,
+        media_type='application/msword',
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
-        filename = f"holiday_document_{datetime.now().strftime('%Y%m%d%H%M%S')}.doc"
 
-        return FileResponse(
-            path=temp_path,
-            filename=filename,
-            media_type='application/msword'
-        )
+@router.get("/templates", response_model=DocumentTemplatesResponse)
+async def get_document_templates():
+    """
+    Доступные шаблоны документов и их форматы
+    """
+    return DocumentTemplatesResponse(templates={
+        name: formats for name, formats in template_registry.names().items() if name in DOCUMENT_SOURCES
+    })
+
+
+@router.get("/{template}")
+async def create_document(
+        template: str,
+        format: str = "doc",
+        params: DocumentParams = Depends(),
+        db: AsyncSession = Depends(get_read_session)
+):
+    """
+    Документ по шаблону: doc (HTML для Word) или rtf, отдается потоком
+    """
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Формат должен быть одним из: {', '.join(FORMATS)}")
+    source = DOCUMENT_SOURCES.get(template)
+    compiled = template_registry.get(template, format) if source is not None else None
+    if compiled is None:
+        raise HTTPException(status_code=404, detail="Шаблон документа не найден")
+
+    context = await source(db, params)
+
+    # Отсутствующие в данных поля обнаруживаются до начала ответа, а не посреди потока
+    try:
+        compiled.check(context)
+    except (TemplateError, AttributeError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка в шаблоне {template}: {str(e)}")
 
-    except Exception as e:
-        # Удаляем временный файл в случае ошибки
-        if temp_path and os.path.exists(temp_path):
-            os.unlink(temp_path)
-        raise HTTPException(status_code=500, detail=f"Ошибка при создании документа: {str(e)}")
\ No newline at end of file
+    _, media_type, _ = FORMATS[format]
+    filename = f"{template}_{datetime.now().strftime('%Y%m%d%H%M%S')}.{format}"
+    return StreamingResponse(
+        compiled.render(context),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -1,13 +1,21 @@
-from pydantic import BaseModel
-from fastapi import APIRouter, HTTPException, Depends
+import csv
+import io
+import json
+from pydantic import BaseModel, ValidationError
+from fastapi import APIRouter, HTTPException, Depends, Header, Request, Response
+from sqlalchemy import bindparam, func, insert, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from typing import List, Optional
 from sqlalchemy.orm import joinedload
-from datetime import date
+from datetime import date, datetime
 
-from app.database import get_session
+from app import audit
+from app.api.fields import parse_fields, sparse_response
+from app.api.versioning import etag, parse_if_match, check_version, version_conflict
+from app.database import get_session, get_read_session
 from app.models import Employee, Otdel, Post, Role, Action, ActionType
+from app.services import remove_from_overtime_rollup, invalidate_overtime_cache
 
 class EmployeeCreate(BaseModel):
     surname: str
@@ -71,6 +79,48 @@ class EmployeeActionResponse(BaseModel):
     actiontype_id: int
     action_type_name: str
 
+class EmployeeImportRow(BaseModel):
+    surname: str
+    name: str
+    patronymic: str
+    login: str
+    password: Optional[str] = None  # обязателен только для новых сотрудников
+    otdel_id: Optional[int] = None
+    name_otdel: Optional[str] = None
+    post_id: Optional[int] = None
+    name_post: Optional[str] = None
+    role_id: int = 2
+
+class EmployeeImportResult(BaseModel):
+    row: int
+    login: Optional[str] = None
+    status: str  # created / updated / skipped / error
+    employee_id: Optional[int] = None
+    error: Optional[str] = None
+
+class EmployeeImportResponse(BaseModel):
+    created: int
+    updated: int
+    errors: int
+    results: List[EmployeeImportResult]
+
+# Поля списка сотрудников для параметра fields= и соответствующие им столбцы
+EMPLOYEE_FIELDS = {
+    "employee_id": Employee.employee_id,
+    "surname": Employee.surname,
+    "name": Employee.name,
+    "patronymic": Employee.patronymic,
+    "login": Employee.login,
+    "idle_hours": Employee.idle_hours,
+    "name_otdel": Otdel.name_otdel,
+    "name_role": Role.name_role,
+    "name_post": Post.name_post,
+}
+
+IMPORT_LOOKUP_CHUNK = 500  # значений в одном IN (...), с запасом до лимита переменных SQLite
+# Поля, которые импорт перезаписывает у существующего сотрудника (пароль - только если передан)
+IMPORT_UPDATE_COLUMNS = ("surname", "name", "patronymic", "login", "otdel_id", "post_id", "role_id")
+
 router = APIRouter(prefix="/employees", tags=["employees"])
 
 
@@ -81,13 +131,13 @@ async def create_employee(employee: EmployeeCreate, db: AsyncSession = Depends(g
     """
     try:
 
-        otdel_result = await db.execute(select(Otdel).where(Otdel.otdel_id == employee.otdel_id))
+        otdel_result = await db.execute(select(Otdel).where(Otdel.otdel_id == employee.otdel_id, Otdel.deleted_at.is_(None)))
         existing_otdel = otdel_result.scalars().first()
         if not existing_otdel:
             raise HTTPException(status_code=400, detail="Отдела с таким id не существует")
 
         # Проверяем существование должности
-        post_result = await db.execute(select(Post).where(Post.post_id == employee.post_id))
+        post_result = await db.execute(select(Post).where(Post.post_id == employee.post_id, Post.deleted_at.is_(None)))
         existing_post = post_result.scalars().first()
         if not existing_post:
             raise HTTPException(status_code=400, detail="Должности с таким id не существует")
@@ -143,6 +193,216 @@ async def create_employee(employee: EmployeeCreate, db: AsyncSession = Depends(g
         raise HTTPException(status_code=500, detail=f"Ошибка при создании сотрудника: {str(e)}")
 
 
+async def _read_import_rows(request: Request) -> List[dict]:
+    """
+    Разбор тела запроса: CSV (text/csv) или JSON-массив сотрудников
+    """
+    body = await request.body()
+    try:
+        if "csv" in request.headers.get("content-type", ""):
+            text = body.decode("utf-8-sig")
+            first_line = text.split("\n", 1)[0]
+            delimiter = ";" if first_line.count(";") > first_line.count(",") else ","
+            # Пустые ячейки опускаем, чтобы сработали значения по умолчанию
+            return [
+                {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+                for row in csv.DictReader(io.StringIO(text), delimiter=delimiter)
+            ]
+
+        data = json.loads(body)
+    except (UnicodeDecodeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Не удалось разобрать файл импорта: {str(e)}")
+
+    if isinstance(data, dict):
+        data = data.get("employees")
+    if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+        raise HTTPException(status_code=400, detail="Ожидается список сотрудников")
+    return data
+
+
+def _resolve_reference(row_id: Optional[int], row_name: Optional[str], ids: set, by_name: dict,
+                       create_missing: bool, missing: set, label: str) -> Optional[str]:
+    """
+    Проверка ссылки на отдел/должность по id или названию, возвращает текст ошибки
+    """
+    if row_id is not None:
+        return None if row_id in ids else f"{label} с id {row_id} не существует"
+    if not row_name:
+        return f"Не указан {label.lower()} (id или название)"
+    if row_name not in by_name:
+        if not create_missing:
+            return f"{label} '{row_name}' не существует"
+        missing.add(row_name)
+    return None
+
+
+@router.post("/import", response_model=EmployeeImportResponse)
+async def import_employees(
+        request: Request,
+        create_missing: bool = False,
+        skip_invalid: bool = False,
+        db: AsyncSession = Depends(get_session)
+):
+    """
+    Массовый импорт сотрудников из CSV или JSON с обновлением по логину.
+    Все строки проверяются заранее; при ошибках ничего не записывается,
+    если не передан skip_invalid=true.
+    """
+    raw_rows = await _read_import_rows(request)
+    results = [EmployeeImportResult(row=index + 1, login=raw.get("login"), status="skipped")
+               for index, raw in enumerate(raw_rows)]
+    rows: dict = {}  # номер строки -> EmployeeImportRow
+
+    # Проверка структуры строк и дубликатов логина внутри файла
+    seen_logins = set()
+    for index, raw in enumerate(raw_rows):
+        try:
+            row = EmployeeImportRow.model_validate(raw)
+        except ValidationError as e:
+            results[index].status = "error"
+            results[index].error = "; ".join(
+                f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors()
+            )
+            continue
+        if row.login in seen_logins:
+            results[index].status = "error"
+            results[index].error = "Логин повторяется в файле импорта"
+            continue
+        seen_logins.add(row.login)
+        rows[index] = row
+
+    # Справочники небольшие - загружаем целиком одним запросом на каждый
+    otdels = {name: otdel_id for otdel_id, name in (await db.execute(
+        select(Otdel.otdel_id, Otdel.name_otdel).where(Otdel.deleted_at.is_(None)))).all()}
+    posts = {name: post_id for post_id, name in (await db.execute(
+        select(Post.post_id, Post.name_post).where(Post.deleted_at.is_(None)))).all()}
+    otdel_ids, post_ids = set(otdels.values()), set(posts.values())
+    role_ids = set((await db.execute(select(Role.role_id))).scalars().all())
+
+    # Существующие сотрудники по логину
+    existing = {}
+    logins = [row.login for row in rows.values()]
+    for start in range(0, len(logins), IMPORT_LOOKUP_CHUNK):
+        result = await db.execute(
+            select(Employee.__table__).where(
+                Employee.login.in_(logins[start:start + IMPORT_LOOKUP_CHUNK]),
+                Employee.deleted_at.is_(None)
+            )
+            .order_by(Employee.employee_id)
+        )
+        for current in result.mappings():
+            existing.setdefault(current["login"], current)
+
+    missing_otdels, missing_posts = set(), set()
+    for index, row in list(rows.items()):
+        error = (
+            _resolve_reference(row.otdel_id, row.name_otdel, otdel_ids, otdels, create_missing, missing_otdels, "Отдел")
+            or _resolve_reference(row.post_id, row.name_post, post_ids, posts, create_missing, missing_posts, "Должность")
+        )
+        if not error and row.role_id not in role_ids:
+            error = f"Роли с id {row.role_id} не существует"
+        if not error and row.login not in existing and not row.password:
+            error = "Для нового сотрудника обязателен пароль"
+        if error:
+            results[index].status = "error"
+            results[index].error = error
+            del rows[index]
+
+    errors = sum(1 for result in results if result.status == "error")
+    if errors and not skip_invalid:
+        return EmployeeImportResponse(created=0, updated=0, errors=errors, results=results)
+
+    try:
+        # Недостающие отделы и должности создаем только для строк, которые будут записаны
+        needed_otdels = {row.name_otdel for row in rows.values() if row.otdel_id is None} & missing_otdels
+        needed_posts = {row.name_post for row in rows.values() if row.post_id is None} & missing_posts
+        if needed_otdels:
+            result = await db.execute(
+                insert(Otdel).returning(Otdel.otdel_id, Otdel.name_otdel),
+                [{"name_otdel": name} for name in sorted(needed_otdels)]
+            )
+            for otdel_id, name in result.all():
+                otdels[name] = otdel_id
+                audit.record(db, "otdel", otdel_id, "insert", {"otdel_id": (None, otdel_id), "name_otdel": (None, name)})
+        if needed_posts:
+            result = await db.execute(
+                insert(Post).returning(Post.post_id, Post.name_post),
+                [{"name_post": name} for name in sorted(needed_posts)]
+            )
+            for post_id, name in result.all():
+                posts[name] = post_id
+                audit.record(db, "post", post_id, "insert", {"post_id": (None, post_id), "name_post": (None, name)})
+
+        to_insert, to_update = [], []
+        for index, row in rows.items():
+            values = {
+                "surname": row.surname,
+                "name": row.name,
+                "patronymic": row.patronymic,
+                "login": row.login,
+                "otdel_id": row.otdel_id if row.otdel_id is not None else otdels[row.name_otdel],
+                "post_id": row.post_id if row.post_id is not None else posts[row.name_post],
+                "role_id": row.role_id,
+            }
+            if row.password:
+                values["password"] = row.password
+            if row.login in existing:
+                to_update.append((index, values))
+            else:
+                to_insert.append((index, values))
+
+        if to_insert:
+            result = await db.execute(
+                insert(Employee).returning(Employee.employee_id, sort_by_parameter_order=True),
+                [dict(values, idle_hours=0) for _, values in to_insert]
+            )
+            for (index, values), employee_id in zip(to_insert, result.scalars().all()):
+                results[index].status = "created"
+                results[index].employee_id = employee_id
+                audit.record(db, "employee", employee_id, "insert",
+                             {key: (None, value) for key, value in dict(values, idle_hours=0).items()})
+
+        if to_update:
+            params = []
+            for index, values in to_update:
+                current = existing[values["login"]]
+                changes = {key: (current[key], value) for key, value in values.items() if current[key] != value}
+                results[index].status = "updated"
+                results[index].employee_id = current["employee_id"]
+                if changes:
+                    params.append({
+                        "b_employee_id": current["employee_id"],
+                        "b_password": values.get("password"),
+                        **{f"b_{key}": values[key] for key in IMPORT_UPDATE_COLUMNS},
+                    })
+                    audit.record(db, "employee", current["employee_id"], "update", changes)
+            if params:
+                # Один executemany; версия увеличивается, чтобы If-Match видел изменение из импорта
+                await db.execute(
+                    update(Employee.__table__)
+                    .where(Employee.employee_id == bindparam("b_employee_id"))
+                    .values(
+                        **{key: bindparam(f"b_{key}") for key in IMPORT_UPDATE_COLUMNS},
+                        password=func.coalesce(bindparam("b_password"), Employee.password),
+                        version=Employee.version + 1
+                    ),
+                    params
+                )
+
+        await db.commit()
+
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Ошибка при импорте сотрудников: {str(e)}")
+
+    return EmployeeImportResponse(
+        created=len(to_insert),
+        updated=len(to_update),
+        errors=errors,
+        results=results
+    )
+
+
 @router.post("/login", response_model=EmployeeLoginResponse)
 async def login_employee(login_data: EmployeeLogin, db: AsyncSession = Depends(get_session)):
     """
@@ -157,7 +417,8 @@ async def login_employee(login_data: EmployeeLogin, db: AsyncSession = Depends(g
                 joinedload(Employee.role)
             ).where(
                 Employee.login == login_data.login,
-                Employee.password == login_data.password
+                Employee.password == login_data.password,
+                Employee.deleted_at.is_(None)
             )
         )
         employee = result.scalars().first()
@@ -190,52 +451,51 @@ async def login_employee(login_data: EmployeeLogin, db: AsyncSession = Depends(g
         )
 
 @router.get("/all", response_model=List[EmployeeResponse])
-async def get_all_employees(db: AsyncSession = Depends(get_session)):
+async def get_all_employees(fields: Optional[str] = None, db: AsyncSession = Depends(get_read_session)):
     """
-    Получение всех сотрудников
+    Получение всех сотрудников.
+    fields=employee_id,surname,... - вернуть только перечисленные поля;
+    из БД выбираются только эти столбцы, справочники присоединяются по необходимости.
     """
-    result = await db.execute(
-        select(Employee).options(
-            joinedload(Employee.otdel),
-            joinedload(Employee.post),
-            joinedload(Employee.role)
-        )
-    )
-    employees = result.scalars().unique().all()
-
-    return [
-        EmployeeResponse(
-            employee_id=emp.employee_id,
-            surname=emp.surname,
-            name=emp.name,
-            patronymic=emp.patronymic,
-            login=emp.login,
-            idle_hours=emp.idle_hours,
-            name_otdel=emp.otdel.name_otdel,
-            name_post=emp.post.name_post,
-            name_role=emp.role.name_role
-        )
-        for emp in employees
-    ]
+    names = parse_fields(fields, EMPLOYEE_FIELDS)
+    columns = [EMPLOYEE_FIELDS[name] for name in names]
+
+    query = select(*columns).select_from(Employee).where(Employee.deleted_at.is_(None))
+    tables = {column.class_ for column in columns}
+    if Otdel in tables:
+        query = query.join(Otdel, Employee.otdel_id == Otdel.otdel_id)
+    if Post in tables:
+        query = query.join(Post, Employee.post_id == Post.post_id)
+    if Role in tables:
+        query = query.join(Role, Employee.role_id == Role.role_id)
+
+    result = await db.execute(query)
+
+    if fields:
+        return sparse_response(result.all(), names)
+
+    return [EmployeeResponse(**row._mapping) for row in result.all()]
 
 
 @router.get("/{employee_id}", response_model=EmployeeResponse)
-async def get_employee(employee_id: int, db: AsyncSession = Depends(get_session)):
+async def get_employee(employee_id: int, response: Response, db: AsyncSession = Depends(get_read_session)):
     """
-    Получение сотрудника по ID
+    Получение сотрудника по ID (версия записи - в заголовке ETag)
     """
     result = await db.execute(
         select(Employee).options(
             joinedload(Employee.otdel),
             joinedload(Employee.post),
             joinedload(Employee.role)
-        ).where(Employee.employee_id == employee_id)
+        ).where(Employee.employee_id == employee_id, Employee.deleted_at.is_(None))
     )
 
     employee = result.scalars().first()
 
     if not employee:
         raise HTTPException(status_code=404, detail="Такой сотрудник не найден")
+    # Остаток часов меняется при начислениях без смены версии - валидатор слабый
+    response.headers["ETag"] = etag(employee.version, weak=True)
     return EmployeeResponse(
             employee_id=employee.employee_id,
             surname=employee.surname,
@@ -250,19 +510,22 @@ async def get_employee(employee_id: int, db: AsyncSession = Depends(get_session)
 @router.put("/{employee_id}/add-hours", response_model= EmployeeResponse)
 async def add_hours(employee_id: int, employee_add_hours: EmployeeAddHours, db: AsyncSession = Depends(get_session)):
 
-    #Получение сотрудника
+    # Атомарное изменение остатка: одновременные начисления не перезаписывают друг друга
     result = await db.execute(
-        select(Employee).where(Employee.employee_id == employee_id)
+        update(Employee)
+        .where(Employee.employee_id == employee_id, Employee.deleted_at.is_(None))
+        .values(idle_hours=Employee.idle_hours + employee_add_hours.idle_hours)
+        .returning(Employee.idle_hours)
+        .execution_options(synchronize_session=False)
     )
-    db_employee = result.scalar_one_or_none()
+    idle_hours = result.scalar_one_or_none()
 
-    if not db_employee:
+    if idle_hours is None:
         raise HTTPException(status_code=404, detail="Такой сотрудник не найден")
 
-    db_employee.idle_hours += employee_add_hours.idle_hours
-
+    audit.record(db, "employee", employee_id, "update",
+                 {"idle_hours": (idle_hours - employee_add_hours.idle_hours, idle_hours)})
     await db.commit()
-    await db.refresh(db_employee)
 
     # Получаем обновленного сотрудника с связанными данными
     result = await db.execute(
@@ -271,6 +534,7 @@ async def add_hours(employee_id: int, employee_add_hours: EmployeeAddHours, db:
             joinedload(Employee.post),
             joinedload(Employee.role)
         ).where(Employee.employee_id == employee_id)
+        .execution_options(populate_existing=True)
     )
 
     employee_with_relations = result.scalars().first()
@@ -293,31 +557,37 @@ async def add_hours(employee_id: int, employee_add_hours: EmployeeAddHours, db:
 async def update_employee(
         employee_id: int,
         employee_update: EmployeeUpdate,
+        response: Response,
+        if_match: Optional[str] = Header(None),
         db: AsyncSession = Depends(get_session)
 ):
     """
-    Частичное обновление сотрудника
+    Частичное обновление сотрудника.
+    С заголовком If-Match изменение выполняется, только если версия записи не менялась, иначе - 412.
     """
+    expected_version = parse_if_match(if_match)
+
     # Получаем сотрудника
     result = await db.execute(
-        select(Employee).where(Employee.employee_id == employee_id)
+        select(Employee).where(Employee.employee_id == employee_id, Employee.deleted_at.is_(None))
     )
     db_employee = result.scalar_one_or_none()
 
     if not db_employee:
         raise HTTPException(status_code=404, detail="Сотрудник не найден")
+    check_version(expected_version, db_employee.version)
 
     # Проверяем и обновляем только переданные поля
     update_data = employee_update.dict(exclude_unset=True)
 
     # Если переданы ID связанных сущностей, проверяем их существование
     if 'otdel_id' in update_data:
-        otdel_result = await db.execute(select(Otdel).where(Otdel.otdel_id == update_data['otdel_id']))
+        otdel_result = await db.execute(select(Otdel).where(Otdel.otdel_id == update_data['otdel_id'], Otdel.deleted_at.is_(None)))
         if not otdel_result.scalar_one_or_none():
             raise HTTPException(status_code=400, detail="Отдела с таким id не существует")
 
     if 'post_id' in update_data:
-        post_result = await db.execute(select(Post).where(Post.post_id == update_data['post_id']))
+        post_result = await db.execute(select(Post).where(Post.post_id == update_data['post_id'], Post.deleted_at.is_(None)))
         if not post_result.scalar_one_or_none():
             raise HTTPException(status_code=400, detail="Должности с таким id не существует")
 
@@ -326,12 +596,23 @@ async def update_employee(
         if not role_result.scalar_one_or_none():
             raise HTTPException(status_code=400, detail="Роли с таким id не существует")
 
-    # Обновляем поля
-    for field, value in update_data.items():
-        setattr(db_employee, field, value)
-
+    # Обновляем поля одним условным UPDATE: не пройдет, если запись успели изменить
+    result = await db.execute(
+        update(Employee)
+        .where(Employee.employee_id == employee_id, Employee.version == db_employee.version)
+        .values(**update_data, version=Employee.version + 1)
+        .returning(Employee.version)
+        .execution_options(synchronize_session=False)
+    )
+    version = result.scalar_one_or_none()
+    if version is None:
+        raise version_conflict()
+
+    changes = {field: (getattr(db_employee, field), value)
+               for field, value in update_data.items() if getattr(db_employee, field) != value}
+    changes["version"] = (db_employee.version, version)
+    audit.record(db, "employee", employee_id, "update", changes)
     await db.commit()
-    await db.refresh(db_employee)
 
     # Получаем обновленного сотрудника с связанными данными
     result = await db.execute(
@@ -340,9 +621,11 @@ async def update_employee(
             joinedload(Employee.post),
             joinedload(Employee.role)
         ).where(Employee.employee_id == employee_id)
+        .execution_options(populate_existing=True)
     )
 
     updated_employee = result.scalars().first()
+    response.headers["ETag"] = etag(version, weak=True)
 
     return EmployeeResponse(
         employee_id=updated_employee.employee_id,
@@ -360,21 +643,37 @@ async def update_employee(
 @router.delete("/{employee_id}")
 async def delete_employee(employee_id: int, db: AsyncSession = Depends(get_session)):
     """
-    Удаление сотрудника
+    Удаление сотрудника (мягкое) вместе с его действиями
     """
-    result = await db.execute(select(Employee).where(Employee.employee_id == employee_id))
-    employee = result.scalar_one_or_none()
+    deleted_at = datetime.now()
+    result = await db.execute(
+        update(Employee)
+        .where(Employee.employee_id == employee_id, Employee.deleted_at.is_(None))
+        .values(deleted_at=deleted_at)
+        .execution_options(synchronize_session=False)
+    )
 
-    if not employee:
+    if not result.rowcount:
         raise HTTPException(status_code=404, detail="Сотрудник не найден")
 
-    await db.delete(employee)
+    result = await db.execute(
+        update(Action)
+        .where(Action.employee_id == employee_id, Action.deleted_at.is_(None))
+        .values(deleted_at=deleted_at)
+        .returning(Action.action_id)
+        .execution_options(synchronize_session=False)
+    )
+    for action_id in result.scalars().all():
+        audit.record(db, "action", action_id, "delete", {"deleted_at": (None, deleted_at)})
+    await remove_from_overtime_rollup(db, [employee_id])
+    audit.record(db, "employee", employee_id, "delete", {"deleted_at": (None, deleted_at)})
     await db.commit()
+    invalidate_overtime_cache([employee_id])
     return {"message": "Сотрудник успешно удален"}
 
 
 @router.get("/{employee_id}/actions", response_model=List[EmployeeActionResponse])
-async def get_actions_by_employee(employee_id: int, db: AsyncSession = Depends(get_session)):
+async def get_actions_by_employee(employee_id: int, db: AsyncSession = Depends(get_read_session)):
     """
     Получение всех действий по ID сотрудника с информацией о сотруднике
     """
@@ -382,7 +681,7 @@ async def get_actions_by_employee(employee_id: int, db: AsyncSession = Depends(g
         select(Action).options(
             joinedload(Action.employee),
             joinedload(Action.actiontype)
-        ).where(Action.employee_id == employee_id)
+        ).where(Action.employee_id == employee_id, Action.deleted_at.is_(None))
     )
     actions = result.scalars().all()
 
@@ -0,0 +1,206 @@
+import csv
+import io
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func
+from sqlalchemy.future import select
+from typing import Optional
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+
+from app.database import get_read_engine
+from app.models import Action, ActionType, Employee, Otdel, Post
+
+
+router = APIRouter(prefix="/export", tags=["export"])
+
+EXPORT_CHUNK_SIZE = 1000  # строк, читаемых с курсора и отдаваемых клиенту за раз
+
+# формат -> (MIME-тип, расширение файла)
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "xls": ("application/vnd.ms-excel", "xls"),  # SpreadsheetML, открывается в Excel
+}
+
+SPREADSHEET_HEADER = """<?xml version="1.0" encoding="utf-8"?>
+<?mso-application progid="Excel.Sheet"?>
+<Workbook xmlns="urn:schemas-microsoft-com:office:spreadsheet"
+          xmlns:ss="urn:schemas-microsoft-com:office:spreadsheet">
+<Worksheet ss:Name="{sheet}">
+<Table>
+"""
+
+SPREADSHEET_FOOTER = """</Table>
+</Worksheet>
+</Workbook>
+"""
+
+
+def _cell(value) -> str:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<Cell><Data ss:Type="Number">{value}</Data></Cell>'
+    return f'<Cell><Data ss:Type="String">{escape(str(value))}</Data></Cell>'
+
+
+def _format_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, date):
+        return value.strftime("%d.%m.%Y")
+    return value
+
+
+def _render_rows(rows, export_format: str) -> str:
+    """
+    Преобразование пачки строк в текст выбранного формата
+    """
+    if export_format == "csv":
+        buffer = io.StringIO()
+        # ';' - разделитель, который Excel в русской локали открывает без импорта
+        csv.writer(buffer, delimiter=";", lineterminator="\r\n").writerows(rows)
+        return buffer.getvalue()
+
+    return "".join(
+        "<Row>" + "".join(_cell(value) for value in row) + "</Row>\n"
+        for row in rows
+    )
+
+
+async def _stream_export(engine, query, header: list, row_builder, export_format: str, sheet: str):
+    """
+    Потоковая выгрузка результата запроса с серверного курсора пачками
+    """
+    # Заголовок отдаем сразу, до выполнения запроса
+    if export_format == "csv":
+        yield ("\ufeff" + _render_rows([header], export_format)).encode("utf-8")
+    else:
+        yield (SPREADSHEET_HEADER.format(sheet=sheet) + _render_rows([header], export_format)).encode("utf-8")
+
+    async with engine.connect() as conn:
+        result = await conn.stream(query.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+        async for rows in result.partitions():
+            yield _render_rows([row_builder(row) for row in rows], export_format).encode("utf-8")
+
+    if export_format == "xls":
+        yield SPREADSHEET_FOOTER.encode("utf-8")
+
+
+def _export_response(query, header: list, row_builder, export_format: str, name: str) -> StreamingResponse:
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Неподдерживаемый формат выгрузки: {export_format}")
+
+    media_type, extension = EXPORT_FORMATS[export_format]
+    filename = f"{name}_{datetime.now().strftime('%Y%m%d%H%M%S')}.{extension}"
+
+    return StreamingResponse(
+        _stream_export(get_read_engine(), query, header, row_builder, export_format, name),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.get("/actions")
+async def export_actions(
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        otdel_id: Optional[int] = None,
+        format: str = "csv"
+):
+    """
+    Выгрузка действий с ФИО сотрудника, отделом и типом действия
+    """
+    query = (
+        select(
+            Action.action_id,
+            Action.date_action,
+            Action.hours,
+            Employee.employee_id,
+            Employee.surname,
+            Employee.name,
+            Employee.patronymic,
+            Otdel.name_otdel,
+            ActionType.name_type
+        )
+        .join(Employee, Action.employee_id == Employee.employee_id)
+        .join(Otdel, Employee.otdel_id == Otdel.otdel_id)
+        .join(ActionType, Action.actiontype_id == ActionType.actiontype_id)
+        .where(Action.deleted_at.is_(None))
+        .order_by(Action.date_action, Action.action_id)
+    )
+    if date_from is not None:
+        query = query.where(Action.date_action >= date_from)
+    if date_to is not None:
+        query = query.where(Action.date_action <= date_to)
+    if otdel_id is not None:
+        query = query.where(Employee.otdel_id == otdel_id)
+
+    header = ["ID действия", "Дата", "Часы", "ID сотрудника", "ФИО", "Отдел", "Тип действия"]
+
+    def row_builder(row):
+        return [
+            row.action_id,
+            _format_value(row.date_action),
+            row.hours,
+            row.employee_id,
+            f"{row.surname} {row.name} {row.patronymic}",
+            row.name_otdel,
+            row.name_type
+        ]
+
+    return _export_response(query, header, row_builder, format, "actions")
+
+
+@router.get("/balances")
+async def export_balances(
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        otdel_id: Optional[int] = None,
+        format: str = "csv"
+):
+    """
+    Выгрузка остатков часов сотрудников с суммой часов за период
+    """
+    period = (
+        select(Action.employee_id, func.sum(Action.hours).label("period_hours"))
+        .where(Action.deleted_at.is_(None))
+        .group_by(Action.employee_id)
+    )
+    if date_from is not None:
+        period = period.where(Action.date_action >= date_from)
+    if date_to is not None:
+        period = period.where(Action.date_action <= date_to)
+    period = period.subquery()
+
+    query = (
+        select(
+            Employee.employee_id,
+            Employee.surname,
+            Employee.name,
+            Employee.patronymic,
+            Otdel.name_otdel,
+            Post.name_post,
+            Employee.idle_hours,
+            func.coalesce(period.c.period_hours, 0).label("period_hours")
+        )
+        .join(Otdel, Employee.otdel_id == Otdel.otdel_id)
+        .join(Post, Employee.post_id == Post.post_id)
+        .outerjoin(period, period.c.employee_id == Employee.employee_id)
+        .where(Employee.deleted_at.is_(None))
+        .order_by(Otdel.name_otdel, Employee.surname, Employee.name)
+    )
+    if otdel_id is not None:
+        query = query.where(Employee.otdel_id == otdel_id)
+
+    header = ["ID сотрудника", "ФИО", "Отдел", "Должность", "Остаток часов", "Часов за период"]
+
+    def row_builder(row):
+        return [
+            row.employee_id,
+            f"{row.surname} {row.name} {row.patronymic}",
+            row.name_otdel,
+            row.name_post,
+            row.idle_hours,
+            row.period_hours
+        ]
+
+    return _export_response(query, header, row_builder, format, "balances")
@@ -0,0 +1,28 @@
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from typing import List, Optional
+
+
+def parse_fields(fields: Optional[str], columns: dict) -> List[str]:
+    """
+    Разбор параметра fields=a,b,c; без параметра возвращаются все поля
+    """
+    if not fields:
+        return list(columns)
+
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in columns]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Неизвестные поля: {', '.join(unknown)}")
+    if not requested:
+        raise HTTPException(status_code=400, detail="Параметр fields не содержит ни одного поля")
+    # Убираем повторы, сохраняя порядок
+    return list(dict.fromkeys(requested))
+
+
+def sparse_response(rows, names: List[str]) -> JSONResponse:
+    """
+    Ответ только с запрошенными полями (минуя полную модель ответа)
+    """
+    return JSONResponse(content=jsonable_encoder([dict(zip(names, row)) for row in rows]))
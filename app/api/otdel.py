@@ -1,11 +1,16 @@
 from pydantic import BaseModel
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Response
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 
-from app.database import get_session  # импорт асинхронной сессии
-from app.models import Otdel
+from app import audit
+from app.api.versioning import etag, parse_if_match, check_version, version_conflict
+from app.database import get_session, get_read_session  # импорт асинхронной сессии
+from app.models import Otdel, Employee, Action
+from app.services import remove_from_overtime_rollup, invalidate_overtime_cache
 
 class OtdelCreate(BaseModel):
     name_otdel: str
@@ -29,7 +34,7 @@ async def create_otdel(otdel: OtdelCreate, db: AsyncSession = Depends(get_sessio
     try:
         # Проверяем, существует ли отдел с таким названием
         result = await db.execute(
-            select(Otdel).where(Otdel.name_otdel == otdel.name_otdel)
+            select(Otdel).where(Otdel.name_otdel == otdel.name_otdel, Otdel.deleted_at.is_(None))
         )
         existing_otdel = result.scalars().first()
 
@@ -50,12 +55,12 @@ async def create_otdel(otdel: OtdelCreate, db: AsyncSession = Depends(get_sessio
 
 
 @router.get("/all", response_model=List[OtdelResponse])
-async def get_all_otdels(db: AsyncSession = Depends(get_session)):
+async def get_all_otdels(db: AsyncSession = Depends(get_read_session)):
     """
        Получение всех отделов
        """
     try:
-        result = await db.execute(select(Otdel))
+        result = await db.execute(select(Otdel).where(Otdel.deleted_at.is_(None)))
         otdels = result.scalars().all()
 
 
@@ -71,46 +76,108 @@ async def get_all_otdels(db: AsyncSession = Depends(get_session)):
 
 
 @router.get("/{otdel_id}", response_model=OtdelResponse)
-async def get_otdel(otdel_id: int, db: AsyncSession = Depends(get_session)):
+async def get_otdel(otdel_id: int, response: Response, db: AsyncSession = Depends(get_read_session)):
     """
-    Получение отдела по ID
+    Получение отдела по ID (версия записи - в заголовке ETag)
     """
-    result = await db.execute(select(Otdel).where(Otdel.otdel_id == otdel_id))
+    result = await db.execute(select(Otdel).where(Otdel.otdel_id == otdel_id, Otdel.deleted_at.is_(None)))
     otdel = result.scalar_one_or_none()
 
     if not otdel:
         raise HTTPException(status_code=404, detail="Отдел не найден")
+    response.headers["ETag"] = etag(otdel.version)
     return otdel
 
 
 @router.put("/{otdel_id}", response_model=OtdelResponse)
-async def update_otdel(otdel_id: int, otdel: OtdelCreate, db: AsyncSession = Depends(get_session)):
+async def update_otdel(
+        otdel_id: int,
+        otdel: OtdelCreate,
+        response: Response,
+        if_match: Optional[str] = Header(None),
+        db: AsyncSession = Depends(get_session)
+):
     """
-    Обновление отдела
+    Обновление отдела. С заголовком If-Match изменение выполняется, только если версия
+    записи не менялась, иначе - 412.
     """
-    result = await db.execute(select(Otdel).where(Otdel.otdel_id == otdel_id))
+    expected_version = parse_if_match(if_match)
+
+    result = await db.execute(select(Otdel).where(Otdel.otdel_id == otdel_id, Otdel.deleted_at.is_(None)))
     db_otdel = result.scalar_one_or_none()
 
     if not db_otdel:
         raise HTTPException(status_code=404, detail="Отдел не найден")
-
-    db_otdel.name_otdel = otdel.name_otdel
+    check_version(expected_version, db_otdel.version)
+
+    # Условный UPDATE вместо блокировки строки: не пройдет, если запись успели изменить
+    result = await db.execute(
+        update(Otdel)
+        .where(Otdel.otdel_id == otdel_id, Otdel.version == db_otdel.version)
+        .values(name_otdel=otdel.name_otdel, version=Otdel.version + 1)
+        .returning(Otdel.version)
+        .execution_options(synchronize_session=False)
+    )
+    version = result.scalar_one_or_none()
+    if version is None:
+        raise version_conflict()
+
+    audit.record(db, "otdel", otdel_id, "update", {
+        "name_otdel": (db_otdel.name_otdel, otdel.name_otdel),
+        "version": (db_otdel.version, version)
+    })
     await db.commit()
-    await db.refresh(db_otdel)
-    return db_otdel
+
+    response.headers["ETag"] = etag(version)
+    return OtdelResponse(otdel_id=otdel_id, name_otdel=otdel.name_otdel)
 
 
 @router.delete("/{otdel_id}")
-async def delete_otdel(otdel_id: int, db: AsyncSession = Depends(get_session)):
+async def delete_otdel(otdel_id: int, cascade: bool = False, db: AsyncSession = Depends(get_session)):
     """
-    Удаление отдела
+    Удаление отдела (мягкое). С cascade=true удаляются и сотрудники отдела с их действиями
     """
-    result = await db.execute(select(Otdel).where(Otdel.otdel_id == otdel_id))
-    otdel = result.scalar_one_or_none()
-
-    if not otdel:
+    result = await db.execute(select(Otdel.otdel_id).where(Otdel.otdel_id == otdel_id, Otdel.deleted_at.is_(None)))
+    if result.scalar_one_or_none() is None:
         raise HTTPException(status_code=404, detail="Отдел не найден")
 
-    await db.delete(otdel)
+    deleted_at = datetime.now()
+    employees = select(Employee.employee_id).where(Employee.otdel_id == otdel_id, Employee.deleted_at.is_(None))
+
+    if not cascade:
+        result = await db.execute(select(employees.exists()))
+        if result.scalar():
+            raise HTTPException(status_code=409, detail="В отделе есть сотрудники, передайте cascade=true для их удаления")
+    else:
+        # Удаляем зависимые строки пакетно, без загрузки объектов в сессию
+        result = await db.execute(
+            update(Action)
+            .where(Action.employee_id.in_(employees), Action.deleted_at.is_(None))
+            .values(deleted_at=deleted_at)
+            .returning(Action.action_id)
+            .execution_options(synchronize_session=False)
+        )
+        for action_id in result.scalars().all():
+            audit.record(db, "action", action_id, "delete", {"deleted_at": (None, deleted_at)})
+        await remove_from_overtime_rollup(db, employees)
+        result = await db.execute(
+            update(Employee)
+            .where(Employee.otdel_id == otdel_id, Employee.deleted_at.is_(None))
+            .values(deleted_at=deleted_at)
+            .returning(Employee.employee_id)
+            .execution_options(synchronize_session=False)
+        )
+        for employee_id in result.scalars().all():
+            audit.record(db, "employee", employee_id, "delete", {"deleted_at": (None, deleted_at)})
+
+    await db.execute(
+        update(Otdel)
+        .where(Otdel.otdel_id == otdel_id)
+        .values(deleted_at=deleted_at)
+        .execution_options(synchronize_session=False)
+    )
+    audit.record(db, "otdel", otdel_id, "delete", {"deleted_at": (None, deleted_at)})
     await db.commit()
+    if cascade:
+        invalidate_overtime_cache()
     return {"message": "Отдел успешно удален"}
\ No newline at end of file
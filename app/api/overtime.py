@@ -0,0 +1,166 @@
+from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from typing import List, Optional
+from datetime import date
+
+from app.database import get_read_session
+from app.models import OvertimeMonthly, Employee, ActionType
+from app.services import compute_overtime
+
+class OvertimeMonthlyResponse(BaseModel):
+    employee_id: int
+    year: int
+    month: int
+    actiontype_id: int
+    name_type: str
+    hours: int
+    actions_count: int
+
+class OvertimeMonthResponse(BaseModel):
+    month: int
+    actiontype_id: int
+    hours: int
+
+class EmployeeYearSummaryResponse(BaseModel):
+    employee_id: int
+    surname: str
+    name: str
+    patronymic: str
+    total_hours: int
+    months: List[OvertimeMonthResponse]
+
+class OvertimeComputedItemResponse(BaseModel):
+    actiontype_id: int
+    day_class: str
+    hours: int
+    multiplier: float
+    weighted_hours: float
+
+class OvertimeComputedResponse(BaseModel):
+    employee_id: int
+    date_from: date
+    date_to: date
+    hours: int
+    weighted_hours: float
+    items: List[OvertimeComputedItemResponse]
+
+
+router = APIRouter(prefix="/overtime", tags=["overtime"])
+
+
+@router.get("/monthly", response_model=List[OvertimeMonthlyResponse])
+async def get_monthly_overtime(
+        year: int,
+        month: Optional[int] = None,
+        employee_id: Optional[int] = None,
+        otdel_id: Optional[int] = None,
+        db: AsyncSession = Depends(get_read_session)
+):
+    """
+    Часы по сотрудникам за месяцы года из помесячной сводки
+    """
+    query = (
+        select(OvertimeMonthly, ActionType.name_type)
+        .join(ActionType, OvertimeMonthly.actiontype_id == ActionType.actiontype_id)
+        .where(OvertimeMonthly.year == year)
+        .order_by(OvertimeMonthly.employee_id, OvertimeMonthly.month, OvertimeMonthly.actiontype_id)
+    )
+    if month is not None:
+        query = query.where(OvertimeMonthly.month == month)
+    if employee_id is not None:
+        query = query.where(OvertimeMonthly.employee_id == employee_id)
+    if otdel_id is not None:
+        query = query.join(Employee, OvertimeMonthly.employee_id == Employee.employee_id) \
+            .where(Employee.otdel_id == otdel_id)
+
+    result = await db.execute(query)
+
+    return [
+        OvertimeMonthlyResponse(
+            employee_id=row.employee_id,
+            year=row.year,
+            month=row.month,
+            actiontype_id=row.actiontype_id,
+            name_type=name_type,
+            hours=row.hours,
+            actions_count=row.actions_count
+        )
+        for row, name_type in result.all()
+    ]
+
+
+@router.get("/yearly/{year}", response_model=List[EmployeeYearSummaryResponse])
+async def get_yearly_overtime(year: int, otdel_id: Optional[int] = None, db: AsyncSession = Depends(get_read_session)):
+    """
+    Годовая сводка по сотрудникам: не более 12 строк сводки на тип действия
+    """
+    query = (
+        select(
+            Employee.employee_id,
+            Employee.surname,
+            Employee.name,
+            Employee.patronymic,
+            OvertimeMonthly.month,
+            OvertimeMonthly.actiontype_id,
+            OvertimeMonthly.hours
+        )
+        .join(OvertimeMonthly, OvertimeMonthly.employee_id == Employee.employee_id)
+        .where(OvertimeMonthly.year == year, Employee.deleted_at.is_(None))
+        .order_by(Employee.surname, Employee.name, Employee.employee_id, OvertimeMonthly.month)
+    )
+    if otdel_id is not None:
+        query = query.where(Employee.otdel_id == otdel_id)
+
+    result = await db.execute(query)
+
+    summaries = {}
+    for row in result.all():
+        summary = summaries.get(row.employee_id)
+        if summary is None:
+            summary = summaries[row.employee_id] = EmployeeYearSummaryResponse(
+                employee_id=row.employee_id,
+                surname=row.surname,
+                name=row.name,
+                patronymic=row.patronymic,
+                total_hours=0,
+                months=[]
+            )
+        summary.total_hours += row.hours
+        summary.months.append(OvertimeMonthResponse(month=row.month, actiontype_id=row.actiontype_id, hours=row.hours))
+
+    return list(summaries.values())
+
+
+@router.get("/computed/employee/{employee_id}", response_model=OvertimeComputedResponse)
+async def get_computed_overtime(employee_id: int, date_from: date, date_to: date,
+                                db: AsyncSession = Depends(get_read_session)):
+    """
+    Часы сотрудника за период с коэффициентами по производственному календарю
+    """
+    result = await db.execute(
+        select(Employee.employee_id).where(Employee.employee_id == employee_id, Employee.deleted_at.is_(None))
+    )
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Такой сотрудник не найден")
+
+    computed = await compute_overtime(db, [employee_id], date_from, date_to)
+    return computed[employee_id]
+
+
+@router.get("/computed/otdel/{otdel_id}", response_model=List[OvertimeComputedResponse])
+async def get_computed_overtime_by_otdel(otdel_id: int, date_from: date, date_to: date,
+                                         db: AsyncSession = Depends(get_read_session)):
+    """
+    Часы сотрудников отдела за период с коэффициентами по производственному календарю
+    """
+    result = await db.execute(
+        select(Employee.employee_id)
+        .where(Employee.otdel_id == otdel_id, Employee.deleted_at.is_(None))
+        .order_by(Employee.employee_id)
+    )
+    employee_ids = result.scalars().all()
+
+    computed = await compute_overtime(db, employee_ids, date_from, date_to)
+    return [computed[employee_id] for employee_id in employee_ids]
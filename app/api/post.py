@@ -1,11 +1,16 @@
 from pydantic import BaseModel
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Response
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 
-from app.database import get_session  # импорт асинхронной сессии
-from app.models import Post
+from app import audit
+from app.api.versioning import etag, parse_if_match, check_version, version_conflict
+from app.database import get_session, get_read_session  # импорт асинхронной сессии
+from app.models import Post, Employee, Action
+from app.services import remove_from_overtime_rollup, invalidate_overtime_cache
 
 class PostCreate(BaseModel):
     name_post: str
@@ -29,7 +34,7 @@ async def create_post(post: PostCreate, db: AsyncSession = Depends(get_session))
     try:
         # Проверяем, существует ли должность с таким названием
         result = await db.execute(
-            select(Post).where(Post.name_post == post.name_post)
+            select(Post).where(Post.name_post == post.name_post, Post.deleted_at.is_(None))
         )
         existing_post = result.scalars().first()
 
@@ -50,12 +55,12 @@ async def create_post(post: PostCreate, db: AsyncSession = Depends(get_session))
 
 
 @router.get("/all", response_model=List[PostResponse])
-async def get_all_posts(db: AsyncSession = Depends(get_session)):
+async def get_all_posts(db: AsyncSession = Depends(get_read_session)):
     """
     Получение всех должностей
     """
     try:
-        result = await db.execute(select(Post))
+        result = await db.execute(select(Post).where(Post.deleted_at.is_(None)))
         posts = result.scalars().all()
 
         # Если Post уже соответствует PostResponse, можно вернуть напрямую
@@ -72,46 +77,108 @@ async def get_all_posts(db: AsyncSession = Depends(get_session)):
 
 
 @router.get("/{post_id}", response_model=PostResponse)
-async def get_post(post_id: int, db: AsyncSession = Depends(get_session)):
+async def get_post(post_id: int, response: Response, db: AsyncSession = Depends(get_read_session)):
     """
-    Получение должности по ID
+    Получение должности по ID (версия записи - в заголовке ETag)
     """
-    result = await db.execute(select(Post).where(Post.post_id == post_id))
+    result = await db.execute(select(Post).where(Post.post_id == post_id, Post.deleted_at.is_(None)))
     post = result.scalar_one_or_none()
 
     if not post:
         raise HTTPException(status_code=404, detail="Такая должность не найдена")
+    response.headers["ETag"] = etag(post.version)
     return post
 
 
 @router.put("/{post_id}", response_model=PostResponse)
-async def update_post(post_id: int, post: PostCreate, db: AsyncSession = Depends(get_session)):
+async def update_post(
+        post_id: int,
+        post: PostCreate,
+        response: Response,
+        if_match: Optional[str] = Header(None),
+        db: AsyncSession = Depends(get_session)
+):
     """
-    Обновление должности
+    Обновление должности. С заголовком If-Match изменение выполняется, только если версия
+    записи не менялась, иначе - 412.
     """
-    result = await db.execute(select(Post).where(Post.post_id == post_id))
+    expected_version = parse_if_match(if_match)
+
+    result = await db.execute(select(Post).where(Post.post_id == post_id, Post.deleted_at.is_(None)))
     db_post = result.scalar_one_or_none()
 
     if not db_post:
         raise HTTPException(status_code=404, detail="Должность не найдена")
-
-    db_post.name_otdel = post.name_post
+    check_version(expected_version, db_post.version)
+
+    # Условный UPDATE вместо блокировки строки: не пройдет, если запись успели изменить
+    result = await db.execute(
+        update(Post)
+        .where(Post.post_id == post_id, Post.version == db_post.version)
+        .values(name_post=post.name_post, version=Post.version + 1)
+        .returning(Post.version)
+        .execution_options(synchronize_session=False)
+    )
+    version = result.scalar_one_or_none()
+    if version is None:
+        raise version_conflict()
+
+    audit.record(db, "post", post_id, "update", {
+        "name_post": (db_post.name_post, post.name_post),
+        "version": (db_post.version, version)
+    })
     await db.commit()
-    await db.refresh(db_post)
-    return db_post
+
+    response.headers["ETag"] = etag(version)
+    return PostResponse(post_id=post_id, name_post=post.name_post)
 
 
 @router.delete("/{post_id}")
-async def delete_post(post_id: int, db: AsyncSession = Depends(get_session)):
+async def delete_post(post_id: int, cascade: bool = False, db: AsyncSession = Depends(get_session)):
     """
-    Удаление должности
+    Удаление должности (мягкое). С cascade=true удаляются и сотрудники на этой должности с их действиями
     """
-    result = await db.execute(select(Post).where(Post.post_id == post_id))
-    post = result.scalar_one_or_none()
-
-    if not post:
+    result = await db.execute(select(Post.post_id).where(Post.post_id == post_id, Post.deleted_at.is_(None)))
+    if result.scalar_one_or_none() is None:
         raise HTTPException(status_code=404, detail="Должность не найдена")
 
-    await db.delete(post)
+    deleted_at = datetime.now()
+    employees = select(Employee.employee_id).where(Employee.post_id == post_id, Employee.deleted_at.is_(None))
+
+    if not cascade:
+        result = await db.execute(select(employees.exists()))
+        if result.scalar():
+            raise HTTPException(status_code=409, detail="Эту должность занимают сотрудники, передайте cascade=true для их удаления")
+    else:
+        # Удаляем зависимые строки пакетно, без загрузки объектов в сессию
+        result = await db.execute(
+            update(Action)
+            .where(Action.employee_id.in_(employees), Action.deleted_at.is_(None))
+            .values(deleted_at=deleted_at)
+            .returning(Action.action_id)
+            .execution_options(synchronize_session=False)
+        )
+        for action_id in result.scalars().all():
+            audit.record(db, "action", action_id, "delete", {"deleted_at": (None, deleted_at)})
+        await remove_from_overtime_rollup(db, employees)
+        result = await db.execute(
+            update(Employee)
+            .where(Employee.post_id == post_id, Employee.deleted_at.is_(None))
+            .values(deleted_at=deleted_at)
+            .returning(Employee.employee_id)
+            .execution_options(synchronize_session=False)
+        )
+        for employee_id in result.scalars().all():
+            audit.record(db, "employee", employee_id, "delete", {"deleted_at": (None, deleted_at)})
+
+    await db.execute(
+        update(Post)
+        .where(Post.post_id == post_id)
+        .values(deleted_at=deleted_at)
+        .execution_options(synchronize_session=False)
+    )
+    audit.record(db, "post", post_id, "delete", {"deleted_at": (None, deleted_at)})
     await db.commit()
+    if cascade:
+        invalidate_overtime_cache()
     return {"message": "Должность успешно удалена"}
\ No newline at end of file
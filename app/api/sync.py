@@ -0,0 +1,144 @@
+import base64
+import binascii
+from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from typing import List, Optional, Tuple
+from datetime import datetime, timedelta
+
+from app.database import get_read_session
+from app.models import Employee, Otdel, Post, SyncSequence
+from app.services import PURGE_RETENTION_DAYS
+
+# Удаленные строки (надгробия) хранятся PURGE_RETENTION_DAYS, для более старого
+# токена изменения уже не восстановить - отдается полный снимок
+SYNC_TOKEN_TTL = timedelta(days=PURGE_RETENTION_DAYS)
+
+class SyncOtdel(BaseModel):
+    otdel_id: int
+    name_otdel: str
+    version: int
+
+class SyncPost(BaseModel):
+    post_id: int
+    name_post: str
+    version: int
+
+class SyncEmployee(BaseModel):
+    employee_id: int
+    surname: str
+    name: str
+    patronymic: str
+    login: str
+    idle_hours: int
+    otdel_id: int
+    post_id: int
+    role_id: int
+    version: int
+
+class SyncDeleted(BaseModel):
+    otdels: List[int] = []
+    posts: List[int] = []
+    employees: List[int] = []
+
+class DirectorySyncResponse(BaseModel):
+    token: str
+    full: bool  # True - полный снимок, локальную копию нужно заменить целиком
+    otdels: List[SyncOtdel]
+    posts: List[SyncPost]
+    employees: List[SyncEmployee]
+    deleted: SyncDeleted
+
+
+router = APIRouter(prefix="/sync", tags=["sync"])
+
+
+def _encode_token(change_seq: int, moment: datetime) -> str:
+    raw = f"{change_seq}:{moment.isoformat()}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_token(token: str) -> Tuple[int, datetime]:
+    """
+    Токен: номер последнего видимого изменения (change_seq) и момент выдачи
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        change_seq, moment = raw.decode().split(":", 1)
+        return int(change_seq), datetime.fromisoformat(moment)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Некорректный токен синхронизации")
+
+
+async def _changes(db: AsyncSession, model, columns, since: Optional[int]):
+    """
+    Активные строки, измененные после изменения since (все - для снимка), и id удаленных после since
+    """
+    query = select(*columns, model.deleted_at)
+    if since is None:
+        query = query.where(model.deleted_at.is_(None))
+    else:
+        query = query.where(model.change_seq > since)
+
+    result = await db.execute(query.order_by(columns[0]))
+    active, deleted = [], []
+    for row in result.all():
+        if row.deleted_at is None:
+            active.append(row)
+        else:
+            deleted.append(row[0])
+    return active, deleted
+
+
+@router.get("/directory", response_model=DirectorySyncResponse)
+async def sync_directory(token: Optional[str] = None, db: AsyncSession = Depends(get_read_session)):
+    """
+    Синхронизация справочника: без токена - полный снимок отделов, должностей и сотрудников,
+    с токеном из предыдущего ответа - только созданные, измененные и удаленные с тех пор строки
+    """
+    # Номер читается до выборки: строки с номером не больше него уже закоммичены (номера
+    # выдаются в порядке коммитов), а закоммиченное позже попадет в следующую выборку
+    now = datetime.now()
+    change_seq = (await db.execute(select(SyncSequence.value).where(SyncSequence.sequence_id == 1))).scalar_one()
+    since = None
+    if token is not None:
+        since, issued_at = _decode_token(token)
+        if now - issued_at > SYNC_TOKEN_TTL:
+            since = None
+
+    otdels, deleted_otdels = await _changes(
+        db, Otdel, [Otdel.otdel_id, Otdel.name_otdel, Otdel.version], since
+    )
+    posts, deleted_posts = await _changes(
+        db, Post, [Post.post_id, Post.name_post, Post.version], since
+    )
+    employees, deleted_employees = await _changes(
+        db, Employee,
+        [Employee.employee_id, Employee.surname, Employee.name, Employee.patronymic, Employee.login,
+         Employee.idle_hours, Employee.otdel_id, Employee.post_id, Employee.role_id, Employee.version],
+        since
+    )
+
+    return DirectorySyncResponse(
+        token=_encode_token(change_seq, now),
+        full=since is None,
+        otdels=[SyncOtdel(otdel_id=row.otdel_id, name_otdel=row.name_otdel, version=row.version) for row in otdels],
+        posts=[SyncPost(post_id=row.post_id, name_post=row.name_post, version=row.version) for row in posts],
+        employees=[
+            SyncEmployee(
+                employee_id=row.employee_id,
+                surname=row.surname,
+                name=row.name,
+                patronymic=row.patronymic,
+                login=row.login,
+                idle_hours=row.idle_hours,
+                otdel_id=row.otdel_id,
+                post_id=row.post_id,
+                role_id=row.role_id,
+                version=row.version
+            )
+            for row in employees
+        ],
+        deleted=SyncDeleted(otdels=deleted_otdels, posts=deleted_posts, employees=deleted_employees)
+    )
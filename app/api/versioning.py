@@ -0,0 +1,34 @@
+from fastapi import HTTPException
+from typing import Optional
+
+
+def etag(version: int, weak: bool = False) -> str:
+    """
+    ETag из версии записи. Слабый (W/"3") - если в ответе есть поля, меняющиеся без смены версии
+    """
+    return f'W/"{version}"' if weak else f'"{version}"'
+
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """
+    Версия из заголовка If-Match ("3" или W/"3"); None - проверка не требуется
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+
+    value = if_match.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    value = value.strip('"')
+    if not value.isdigit():
+        raise HTTPException(status_code=400, detail="Некорректный заголовок If-Match")
+    return int(value)
+
+
+def version_conflict() -> HTTPException:
+    return HTTPException(status_code=412, detail="Запись была изменена другим пользователем, обновите данные")
+
+
+def check_version(expected: Optional[int], current: int):
+    if expected is not None and expected != current:
+        raise version_conflict()
@@ -0,0 +1,199 @@
+import asyncio
+import json
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event, inspect, insert
+from sqlalchemy.orm import Session
+
+from app.context import current_actor
+from app.database import engine
+from app.models import AuditLog
+
+
+logger = logging.getLogger(__name__)
+
+AUDIT_BUFFER_SIZE = 50000     # максимум записей, ожидающих записи в БД
+AUDIT_BATCH_SIZE = 500        # записей в одном пакетном INSERT
+AUDIT_FLUSH_INTERVAL = 1.0    # секунд между фоновыми сбросами буфера
+
+AUDITED_TABLES = {"employee", "action", "otdel", "post"}
+HIDDEN_FIELDS = {"password"}
+
+def _value(value):
+    if value is None or isinstance(value, (int, float, str, bool)):
+        return value
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def _pair(key: str, old, new) -> list:
+    if key in HIDDEN_FIELDS:
+        return ["***" if old is not None else None, "***" if new is not None else None]
+    return [_value(old), _value(new)]
+
+
+def _diff(obj, operation: str) -> dict:
+    """
+    Изменения объекта в виде {поле: [было, стало]}
+    """
+    state = inspect(obj)
+    changes = {}
+    for attr in state.mapper.column_attrs:
+        key = attr.key
+        if operation == "insert":
+            old, new = None, getattr(obj, key)
+        elif operation == "delete":
+            old, new = state.attrs[key].loaded_value, None
+        else:
+            history = state.attrs[key].history
+            if not history.has_changes():
+                continue
+            old = history.deleted[0] if history.deleted else None
+            new = history.added[0] if history.added else None
+        changes[key] = _pair(key, old, new)
+    return changes
+
+
+def _make_entry(table_name: str, entity_id: Optional[int], operation: str, changes: dict) -> dict:
+    return {
+        "created_at": datetime.now(),
+        "table_name": table_name,
+        "entity_id": entity_id,
+        "operation": operation,
+        "employee_id": current_actor.get(),
+        "changes": json.dumps(changes, ensure_ascii=False),
+    }
+
+
+def _entry(obj, operation: str) -> Optional[dict]:
+    state = inspect(obj)
+    table_name = state.mapper.local_table.name
+    if table_name not in AUDITED_TABLES:
+        return None
+    changes = _diff(obj, operation)
+    if not changes:
+        return None
+    identity = state.mapper.primary_key_from_instance(obj)
+    return _make_entry(table_name, identity[0] if identity else None, operation, changes)
+
+
+def record(session, table_name: str, entity_id: Optional[int], operation: str, changes: dict):
+    """
+    Добавляет запись аудита для изменений, выполненных в обход ORM (массовые INSERT/UPDATE).
+    Запись попадет в журнал только после коммита сессии.
+    """
+    changes = {key: _pair(key, old, new) for key, (old, new) in changes.items()}
+    session.info.setdefault("audit_pending", []).append(_make_entry(table_name, entity_id, operation, changes))
+
+
+class AuditWriter:
+    """
+    Буфер журнала аудита с фоновой пакетной записью в таблицу audit_log
+    """
+
+    def __init__(self, maxsize: int = AUDIT_BUFFER_SIZE):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._buffer = deque()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def add(self, entries: list):
+        for entry in entries:
+            if len(self._buffer) >= self.maxsize:
+                # Не блокируем запись основной транзакции: теряем запись аудита и считаем потери
+                self.dropped += 1
+                logger.warning("Буфер аудита переполнен, запись отброшена")
+                continue
+            self._buffer.append(entry)
+        if len(self._buffer) >= AUDIT_BATCH_SIZE:
+            self._wakeup.set()
+
+    async def flush(self):
+        """
+        Записывает все накопленные записи пакетами по AUDIT_BATCH_SIZE
+        """
+        async with self._lock:
+            while self._buffer:
+                batch = [self._buffer.popleft() for _ in range(min(AUDIT_BATCH_SIZE, len(self._buffer)))]
+                try:
+                    async with engine.begin() as conn:
+                        await conn.execute(insert(AuditLog), batch)
+                except asyncio.CancelledError:
+                    self._requeue(batch)
+                    raise
+                except Exception:
+                    logger.exception("Ошибка записи журнала аудита")
+                    self._requeue(batch)
+                    break
+
+    def _requeue(self, batch: list):
+        # Возвращаем пакет в начало буфера, чтобы повторить при следующем сбросе
+        free = self.maxsize - len(self._buffer)
+        self.dropped += max(len(batch) - free, 0)
+        self._buffer.extendleft(reversed(batch[:free]))
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=AUDIT_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Останавливает фоновую задачу и сбрасывает остаток буфера.
+        Текущий сброс не прерывается: задача дописывает его и завершается сама.
+        """
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._stopping = False
+        await self.flush()
+        if self._buffer:
+            self.dropped += len(self._buffer)
+            logger.error("При остановке не записано записей аудита: %d", len(self._buffer))
+            self._buffer.clear()
+
+
+audit_writer = AuditWriter()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    pending = session.info.setdefault("audit_pending", [])
+    for operation, objects in (("insert", session.new), ("update", session.dirty), ("delete", session.deleted)):
+        for obj in objects:
+            entry = _entry(obj, operation)
+            if entry:
+                pending.append(entry)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_changes(session):
+    pending = session.info.pop("audit_pending", None)
+    if pending:
+        audit_writer.add(pending)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_changes(session, previous_transaction):
+    session.info.pop("audit_pending", None)
+
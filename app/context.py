@@ -0,0 +1,29 @@
+from contextvars import ContextVar
+from typing import Optional
+
+
+# Сотрудник, выполняющий текущий запрос (заголовок X-Employee-Id)
+current_actor: ContextVar[Optional[int]] = ContextVar("current_actor", default=None)
+
+# Ключ клиента текущего запроса: сотрудник, а если он не указан - IP-адрес
+current_client: ContextVar[Optional[str]] = ContextVar("current_client", default=None)
+
+
+async def request_context_middleware(request, call_next):
+    """
+    Привязывает сотрудника и клиента текущего запроса к контексту выполнения
+    """
+    header = request.headers.get("X-Employee-Id")
+    actor = int(header) if header and header.isdigit() else None
+    if actor is not None:
+        client = f"employee:{actor}"
+    else:
+        client = f"ip:{request.client.host if request.client else 'unknown'}"
+
+    actor_token = current_actor.set(actor)
+    client_token = current_client.set(client)
+    try:
+        return await call_next(request)
+    finally:
+        current_client.reset(client_token)
+        current_actor.reset(actor_token)
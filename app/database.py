@@ -1,17 +1,128 @@
+import os
+import time
+from urllib.parse import quote
+from sqlalchemy import event, inspect, make_url, text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.schema import CreateColumn
+from app.context import current_client
+from app.logs import instrument_engine
+from app.ratelimit import RATE_LIMITS, WRITE_CONCURRENCY
 from app.models import Base
-from app.models import Role, ActionType
+from app.models import Role, ActionType, SyncSequence
 
 
-DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 
-engine = create_async_engine(DATABASE_URL, echo=True)
+def _read_only_url(database_url: str) -> str:
+    """
+    Реплика по умолчанию: для файла SQLite - тот же файл, открытый только на чтение через URI,
+    для остальных БД (и SQLite в памяти) - сама основная БД
+    """
+    url = make_url(database_url)
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return database_url
+    url = url.set(
+        database="file:" + quote(url.database, safe="/:"),
+        query={**url.query, "mode": "ro", "uri": "true"}
+    )
+    return url.render_as_string(hide_password=False)
+
+
+# Основная БД (запись) и реплика для чтения. Для SQLite репликой служит
+# то же файловое хранилище, открытое только на чтение через URI.
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./test.db")
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL", _read_only_url(DATABASE_URL))
+
+# Основная БД: запросы на запись, пропущенные общим лимитом лимитера (app/ratelimit.py),
+# и фоновые задачи. Больше пишущих соединений SQLite не ускоряет (одна запись за раз),
+# а только удлиняет очередь на блокировку: лишние запросы ждут в очереди лимитера или получают 503.
+BACKGROUND_CONNECTIONS = 2  # запись журнала аудита и очистка удаленных строк
+WRITE_POOL_SIZE = WRITE_CONCURRENCY + BACKGROUND_CONNECTIONS
+# Сверх пула - только GET, читающие свои записи с основной БД (READ_YOUR_WRITES_WINDOW):
+# в WAL читатели не ждут блокировку записи. Их число ограничено лимитами маршрутов.
+ROUTE_CONCURRENCY = sum(limit.concurrency for limit in RATE_LIMITS.values())
+WRITE_MAX_OVERFLOW = ROUTE_CONCURRENCY
+READ_POOL_SIZE = 10
+READ_MAX_OVERFLOW = max(ROUTE_CONCURRENCY - READ_POOL_SIZE, 0)
+
+# Ожидание блокировки записи SQLite. При WRITE_CONCURRENCY коротких транзакций
+# в очереди значения по умолчанию (5 с) достаточно; превышение - признак перегрузки.
+SQLITE_BUSY_TIMEOUT = 5
+SQLITE_CONNECT_ARGS = {"timeout": SQLITE_BUSY_TIMEOUT} if DATABASE_URL.startswith("sqlite") else {}
+
+READ_YOUR_WRITES_WINDOW = 5.0  # секунд после записи клиента, когда он читает с основной БД
+
+engine = create_async_engine(
+    DATABASE_URL,
+    pool_size=WRITE_POOL_SIZE,
+    max_overflow=WRITE_MAX_OVERFLOW,
+    connect_args=SQLITE_CONNECT_ARGS
+)
+read_engine = create_async_engine(
+    READ_DATABASE_URL,
+    pool_size=READ_POOL_SIZE,
+    max_overflow=READ_MAX_OVERFLOW
+)
+# Вместо echo: счетчик запросов для журнала доступа и журнал медленных запросов
+instrument_engine(engine)
+instrument_engine(read_engine)
+
+
+class WriteSession(Session):
+    """
+    Сессия основной БД, отмечающая клиентов, которые только что записали данные
+    """
+
+
 async_session = sessionmaker(
     bind=engine,
     class_=AsyncSession,
+    sync_session_class=WriteSession,
     expire_on_commit=False
 )
+async_read_session = sessionmaker(
+    bind=read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False
+)
+
+# клиент -> момент последней записи (time.monotonic)
+_last_writes = {}
+_LAST_WRITES_LIMIT = 10000
+
+
+@event.listens_for(WriteSession, "after_flush")
+def _flushed(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(WriteSession, "do_orm_execute")
+def _executed(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(WriteSession, "after_commit")
+def _committed(session):
+    client = current_client.get()
+    if session.info.pop("wrote", False) and client is not None:
+        now = time.monotonic()
+        if len(_last_writes) >= _LAST_WRITES_LIMIT:
+            for key in [key for key, at in _last_writes.items() if now - at > READ_YOUR_WRITES_WINDOW]:
+                del _last_writes[key]
+        _last_writes[client] = now
+
+
+def _reads_from_primary() -> bool:
+    written_at = _last_writes.get(current_client.get())
+    return written_at is not None and time.monotonic() - written_at < READ_YOUR_WRITES_WINDOW
+
+
+def get_read_engine():
+    """
+    Движок для чтения с учетом недавних записей текущего клиента
+    """
+    return engine if _reads_from_primary() else read_engine
 
 async def create_default_roles():
     async with async_session() as session:
@@ -31,13 +142,49 @@ async def create_defualt_actiontypes():
          ])
          await session.commit()
 
+async def create_sync_sequence():
+    async with async_session() as session:
+        if not await session.get(SyncSequence, 1):
+            session.add(SyncSequence(sequence_id=1, value=0))
+            await session.commit()
+
+def migrate_schema(conn):
+    """
+    Добавление новых столбцов и индексов в уже существующие таблицы
+    (create_all создает только отсутствующие таблицы)
+    """
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
 async def init_db():
+    if engine.dialect.name == "sqlite":
+        # WAL позволяет читателям реплики работать параллельно с записью
+        async with engine.connect() as conn:
+            await conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(migrate_schema)
 
     await create_default_roles()
     await create_defualt_actiontypes()
+    await create_sync_sequence()
 
 async def get_session() -> AsyncSession:
     async with async_session() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+async def get_read_session() -> AsyncSession:
+    """
+    Сессия для GET-обработчиков: реплика, либо основная БД сразу после записи клиента
+    """
+    factory = async_session if _reads_from_primary() else async_read_session
+    async with factory() as session:
+        yield session
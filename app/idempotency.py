@@ -0,0 +1,223 @@
+import asyncio
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.future import select
+
+from app.database import engine
+from app.models import IdempotencyKey
+
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL = timedelta(hours=24)  # сколько хранится ответ для повторов
+IDEMPOTENCY_CACHE_SIZE = 1000          # ответов в LRU-кэше в памяти
+IDEMPOTENT_METHODS = {"POST", "PUT", "PATCH"}
+MAX_KEY_LENGTH = 255
+
+
+class _StoredResponse:
+    __slots__ = ("request_hash", "status_code", "headers", "body", "expires_at")
+
+    def __init__(self, request_hash: bytes, status_code: int, headers: list, body: bytes, expires_at: datetime):
+        self.request_hash = request_hash
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.expires_at = expires_at
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+def _client_identity(scope) -> bytes:
+    """
+    Сотрудник из заголовка X-Employee-Id: ключи разных сотрудников с одинаковым значением не пересекаются.
+    IP-адрес не учитывается - повтор из другой сети (мобильный клиент) должен получить сохраненный ответ.
+    """
+    for name, value in scope["headers"]:
+        if name == b"x-employee-id":
+            return value
+    return b""
+
+
+async def _send_json(send, status: int, detail: str):
+    body = json.dumps({"detail": detail}, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class IdempotencyMiddleware:
+    """
+    Повтор POST/PUT/PATCH с тем же Idempotency-Key возвращает сохраненный ответ
+    без повторного выполнения обработчика. Одновременные дубликаты ждут
+    завершения первого запроса. Ответы с кодом 5xx не сохраняются, чтобы
+    клиент мог повторить запрос после сбоя.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._cache = OrderedDict()
+        self._in_flight = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in IDEMPOTENT_METHODS:
+            return await self.app(scope, receive, send)
+
+        client_key = None
+        for name, value in scope["headers"]:
+            if name == b"idempotency-key":
+                client_key = value
+                break
+        if client_key is None:
+            return await self.app(scope, receive, send)
+        if not client_key or len(client_key) > MAX_KEY_LENGTH:
+            return await _send_json(send, 400, "Некорректный заголовок Idempotency-Key")
+
+        body = await _read_body(receive)
+        request_hash = hashlib.sha256(body).digest()
+        key = hashlib.sha256(b"\n".join([
+            scope["method"].encode(), scope["path"].encode(), _client_identity(scope), client_key
+        ])).digest()
+
+        # Кэш и выполняющиеся запросы проверяются без await до регистрации своего выполнения,
+        # чтобы два запроса с одним ключом не могли одновременно решить, что ответа еще нет
+        while True:
+            stored = self._cached(key)
+            if stored is not None:
+                return await self._respond(send, stored, request_hash)
+
+            waiter = self._in_flight.get(key)
+            if waiter is None:
+                break
+            # Дубликат ждет первое выполнение, затем проверяет сохраненный ответ заново
+            await asyncio.shield(waiter)
+
+        done = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = done
+        try:
+            stored = await self._load(key)
+            if stored is not None:
+                return await self._respond(send, stored, request_hash)
+            await self._execute(scope, receive, body, send, key, request_hash)
+        finally:
+            del self._in_flight[key]
+            done.set_result(None)
+
+    async def _respond(self, send, stored: _StoredResponse, request_hash: bytes):
+        if stored.request_hash != request_hash:
+            return await _send_json(send, 422, "Idempotency-Key уже использован для другого запроса")
+        return await self._replay(send, stored)
+
+    async def _execute(self, scope, receive, body: bytes, send, key: bytes, request_hash: bytes):
+        body_sent = False
+
+        async def replay_receive():
+            # Тело уже прочитано для хэша - отдаем его приложению целиком,
+            # дальше ждем события исходного соединения (например, разрыва)
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        response = {"status": None, "headers": [], "body": [], "complete": False}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                # Копия: внешние middleware (GZip) дописывают заголовки в этот же список
+                response["headers"] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    response["complete"] = True
+            await send(message)
+
+        await self.app(scope, replay_receive, capture_send)
+
+        if response["complete"] and response["status"] < 500:
+            stored = _StoredResponse(
+                request_hash=request_hash,
+                status_code=response["status"],
+                headers=[[name.decode("latin-1"), value.decode("latin-1")] for name, value in response["headers"]],
+                body=b"".join(response["body"]),
+                expires_at=datetime.now() + IDEMPOTENCY_TTL
+            )
+            await self._store(key, stored)
+
+    def _cached(self, key: bytes) -> Optional[_StoredResponse]:
+        stored = self._cache.get(key)
+        if stored is not None:
+            if stored.expires_at > datetime.now():
+                self._cache.move_to_end(key)
+                return stored
+            del self._cache[key]
+        return None
+
+    async def _load(self, key: bytes) -> Optional[_StoredResponse]:
+        # Читаем с основной БД: реплика может еще не увидеть только что сохраненный ответ
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                select(IdempotencyKey).where(IdempotencyKey.key == key, IdempotencyKey.expires_at > datetime.now())
+            )
+            row = result.first()
+        if row is None:
+            return None
+
+        stored = _StoredResponse(row.request_hash, row.status_code, json.loads(row.headers), row.body, row.expires_at)
+        self._remember(key, stored)
+        return stored
+
+    async def _store(self, key: bytes, stored: _StoredResponse):
+        self._remember(key, stored)
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(
+                    sqlite_insert(IdempotencyKey.__table__).on_conflict_do_nothing(),
+                    {
+                        "key": key,
+                        "request_hash": stored.request_hash,
+                        "status_code": stored.status_code,
+                        "headers": json.dumps(stored.headers),
+                        "body": stored.body,
+                        "expires_at": stored.expires_at,
+                    }
+                )
+        except Exception:
+            # Ответ уже отдан клиенту; без записи в БД повтор защищает только кэш в памяти
+            logger.exception("Не удалось сохранить ответ для Idempotency-Key")
+
+    def _remember(self, key: bytes, stored: _StoredResponse):
+        self._cache[key] = stored
+        self._cache.move_to_end(key)
+        while len(self._cache) > IDEMPOTENCY_CACHE_SIZE:
+            self._cache.popitem(last=False)
+
+    @staticmethod
+    async def _replay(send, stored: _StoredResponse):
+        await send({
+            "type": "http.response.start",
+            "status": stored.status_code,
+            "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in stored.headers]
+                       + [(b"idempotent-replayed", b"true")],
+        })
+        await send({"type": "http.response.body", "body": stored.body})
@@ -0,0 +1,197 @@
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from sqlalchemy import event
+
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+ACCESS_LOG_SAMPLE_RATE = float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "0.1"))  # доля успешных запросов в журнале
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))  # медленные запросы пишутся всегда
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))      # порог журнала медленных SQL-запросов
+SLOW_QUERY_MAX_LENGTH = 2000  # символов SQL в записи о медленном запросе
+
+access_logger = logging.getLogger("app.access")
+sql_logger = logging.getLogger("app.sql")
+
+
+class _RequestStats:
+    __slots__ = ("sql_count", "sql_ms")
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_ms = 0.0
+
+
+# Счетчики SQL текущего запроса
+_request_stats: ContextVar[Optional[_RequestStats]] = ContextVar("request_stats", default=None)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Запись журнала одной строкой JSON; поля из extra={"fields": {...}} добавляются в корень
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(QueueHandler):
+    """
+    Кладет в очередь саму запись без форматирования: JSON собирается в потоке записи
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Трассировку нельзя передать между потоками как объект - форматируем сразу
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging():
+    """
+    Направляет журналы приложения (логгеры app.*) в очередь, которую
+    в отдельном потоке разбирает запись в stdout: цикл событий не блокируется вводом-выводом
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter()
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger("app")
+    root.setLevel(LOG_LEVEL)
+    root.handlers = [_QueueHandler(log_queue)]
+    root.propagate = False
+
+
+def shutdown_logging():
+    """
+    Дописывает оставшиеся в очереди записи и останавливает поток
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - context._query_started) * 1000
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.sql_count += 1
+        stats.sql_ms += elapsed_ms
+    if elapsed_ms >= SLOW_QUERY_MS:
+        sql_logger.warning("slow query", extra={"fields": {
+            "duration_ms": round(elapsed_ms, 1),
+            "statement": statement[:SLOW_QUERY_MAX_LENGTH],
+            "executemany": executemany,
+        }})
+
+
+def instrument_engine(engine):
+    """
+    Подсчет SQL-запросов для журнала доступа и журнал медленных запросов
+    """
+    sync_engine = engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class AccessLogMiddleware:
+    """
+    Журнал доступа в JSON: маршрут, статус, длительность, сотрудник, число SQL-запросов.
+    Успешные запросы пишутся с долей ACCESS_LOG_SAMPLE_RATE, ошибки и медленные - всегда.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        stats = _RequestStats()
+        token = _request_stats.set(stats)
+        status = None
+
+        async def capture_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture_send)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            _request_stats.reset(token)
+            latency_ms = (time.perf_counter() - started) * 1000
+            if status is None or status >= 400 or latency_ms >= SLOW_REQUEST_MS \
+                    or random.random() < ACCESS_LOG_SAMPLE_RATE:
+                self._log(scope, status, latency_ms, stats)
+
+    @staticmethod
+    def _log(scope, status: Optional[int], latency_ms: float, stats: _RequestStats):
+        route = scope.get("route")
+        employee_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-employee-id" and value.isdigit():
+                employee_id = int(value)
+                break
+
+        if status is None or status >= 500:
+            level = logging.ERROR
+        elif status >= 400 or latency_ms >= SLOW_REQUEST_MS:
+            level = logging.WARNING
+        else:
+            level = logging.INFO
+
+        access_logger.log(level, "request", extra={"fields": {
+            "method": scope["method"],
+            "route": route.path if route is not None else None,
+            "path": scope["path"],
+            "status": status,
+            "latency_ms": round(latency_ms, 1),
+            "employee_id": employee_id,
+            "sql_count": stats.sql_count,
+            "sql_ms": round(stats.sql_ms, 1),
+        }})
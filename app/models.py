@@ -1,18 +1,67 @@
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Enum, Date
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Enum, Date, DateTime, Text, Index, LargeBinary, text, update
 from sqlalchemy.orm import relationship
+from datetime import datetime
 
 Base = declarative_base()
 
+# Счетчик изменений справочника (одна строка) - курсор синхронизации
+class SyncSequence(Base):
+    __tablename__ = 'sync_sequence'
+    sequence_id = Column(Integer, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+
+def next_change_seq(context) -> int:
+    """
+    Номер изменения для change_seq: счетчик увеличивается внутри пишущей транзакции,
+    а SQLite выполняет их по одной, поэтому номера идут в порядке коммитов
+    (метка времени ставится до ожидания блокировки записи и этого не гарантирует).
+    Все строки одной транзакции получают один номер.
+    """
+    connection = context.connection
+    transaction = connection.get_transaction()
+    assigned = connection.info.get("change_seq")
+    if assigned is not None and assigned[0] is transaction:
+        return assigned[1]
+    value = connection.execute(
+        update(SyncSequence.__table__)
+        .where(SyncSequence.sequence_id == 1)
+        .values(value=SyncSequence.value + 1)
+        .returning(SyncSequence.value)
+    ).scalar_one()
+    connection.info["change_seq"] = (transaction, value)
+    return value
+
+
 class Otdel(Base):
     __tablename__ = 'otdel'
     otdel_id = Column(Integer, primary_key=True)
     name_otdel = Column(String, nullable=False)
+    deleted_at = Column(DateTime)
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+    change_seq = Column(Integer, default=next_change_seq, onupdate=next_change_seq)  # для синхронизации справочника
+
+    # Частичные индексы покрывают только активные (не удаленные) строки
+    __table_args__ = (
+        Index('ix_otdel_active_name', 'name_otdel', sqlite_where=text('deleted_at IS NULL')),
+        Index('ix_otdel_deleted_at', 'deleted_at', sqlite_where=text('deleted_at IS NOT NULL')),
+        Index('ix_otdel_change_seq', 'change_seq'),
+    )
 
 class Post(Base):
     __tablename__ = 'post'
     post_id = Column(Integer, primary_key=True)
     name_post = Column(String, nullable=False)
+    deleted_at = Column(DateTime)
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+    change_seq = Column(Integer, default=next_change_seq, onupdate=next_change_seq)
+
+    __table_args__ = (
+        Index('ix_post_active_name', 'name_post', sqlite_where=text('deleted_at IS NULL')),
+        Index('ix_post_deleted_at', 'deleted_at', sqlite_where=text('deleted_at IS NOT NULL')),
+        Index('ix_post_change_seq', 'change_seq'),
+    )
 
 class Role(Base):
     __tablename__ = 'role'
@@ -31,11 +80,21 @@ class Employee(Base):
     otdel_id = Column(Integer, ForeignKey('otdel.otdel_id'), nullable=False)
     post_id = Column(Integer, ForeignKey('post.post_id'), nullable=False)
     role_id = Column(Integer, ForeignKey('role.role_id'), nullable=False)
+    deleted_at = Column(DateTime)
+    version = Column(Integer, nullable=False, default=1, server_default='1')  # для If-Match при изменении
+    change_seq = Column(Integer, default=next_change_seq, onupdate=next_change_seq)
 
     otdel = relationship('Otdel')
     post = relationship('Post')
     role = relationship('Role')
 
+    __table_args__ = (
+        Index('ix_employee_active_login', 'login', sqlite_where=text('deleted_at IS NULL')),
+        Index('ix_employee_active_otdel', 'otdel_id', sqlite_where=text('deleted_at IS NULL')),
+        Index('ix_employee_deleted_at', 'deleted_at', sqlite_where=text('deleted_at IS NOT NULL')),
+        Index('ix_employee_change_seq', 'change_seq'),
+    )
+
 class ActionType(Base):
     __tablename__ = 'actiontype'
     actiontype_id = Column(Integer, primary_key=True)
@@ -48,7 +107,51 @@ class Action(Base):
     date_action = Column(Date, nullable=False)
     employee_id = Column(Integer, ForeignKey('employee.employee_id'), nullable=False)
     actiontype_id = Column(Integer, ForeignKey('actiontype.actiontype_id'), nullable=False)
+    deleted_at = Column(DateTime)
 
     employee = relationship('Employee')
     actiontype = relationship('ActionType')
 
+    __table_args__ = (
+        Index('ix_action_active_employee_date', 'employee_id', 'date_action', sqlite_where=text('deleted_at IS NULL')),
+        Index('ix_action_deleted_at', 'deleted_at', sqlite_where=text('deleted_at IS NOT NULL')),
+    )
+
+# Помесячная сводка часов, обновляется в одной транзакции с изменениями action
+class OvertimeMonthly(Base):
+    __tablename__ = 'overtime_monthly'
+    employee_id = Column(Integer, ForeignKey('employee.employee_id'), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    month = Column(Integer, primary_key=True)
+    actiontype_id = Column(Integer, ForeignKey('actiontype.actiontype_id'), primary_key=True)
+    hours = Column(Integer, nullable=False, default=0)
+    actions_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_overtime_monthly_year', 'year', 'month'),
+    )
+
+class AuditLog(Base):
+    __tablename__ = 'audit_log'
+    audit_id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, nullable=False)
+    table_name = Column(String, nullable=False)
+    entity_id = Column(Integer)
+    operation = Column(String, nullable=False)
+    employee_id = Column(Integer)  # кто выполнил изменение (без FK: сотрудник может быть удален)
+    changes = Column(Text, nullable=False)
+
+    __table_args__ = (
+        Index('ix_audit_log_entity', 'table_name', 'entity_id'),
+        Index('ix_audit_log_created_at', 'created_at'),
+    )
+
+# Сохраненные ответы для повторов запросов с заголовком Idempotency-Key
+class IdempotencyKey(Base):
+    __tablename__ = 'idempotency_key'
+    key = Column(LargeBinary, primary_key=True)  # sha256 от метода, пути и ключа клиента
+    request_hash = Column(LargeBinary, nullable=False)  # sha256 тела запроса
+    status_code = Column(Integer, nullable=False)
+    headers = Column(Text, nullable=False)
+    body = Column(LargeBinary, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import math
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class RouteLimit:
+    rate: float       # запросов в секунду на одного клиента
+    burst: int        # емкость корзины токенов (допустимый всплеск)
+    concurrency: int  # одновременных запросов к маршруту от всех клиентов
+
+
+# Лимиты по префиксу маршрута, выбирается самый длинный подходящий префикс.
+# Пул реплики (см. app/database.py) рассчитывается от суммы concurrency,
+# чтобы отказ происходил до исчерпания пула; поэтому лимит есть у всех маршрутов с БД.
+RATE_LIMITS = {
+    "/employees": RouteLimit(rate=10, burst=20, concurrency=4),
+    "/employees/login": RouteLimit(rate=5, burst=20, concurrency=2),  # отдельно, чтобы списки не мешали входу
+    "/actions": RouteLimit(rate=10, burst=20, concurrency=4),
+    "/documents": RouteLimit(rate=1, burst=5, concurrency=2),
+    "/export": RouteLimit(rate=0.2, burst=3, concurrency=1),
+    "/sync": RouteLimit(rate=1, burst=5, concurrency=2),  # полный снимок - при первом запуске клиента
+    "/otdels": RouteLimit(rate=10, burst=20, concurrency=2),
+    "/posts": RouteLimit(rate=10, burst=20, concurrency=2),
+    "/overtime": RouteLimit(rate=2, burst=10, concurrency=2),
+    "/audit": RouteLimit(rate=2, burst=10, concurrency=1),
+}
+
+# Общий лимит одновременных запросов к основной БД (изменяющие методы всех маршрутов).
+# SQLite выполняет одну запись за раз, а ожидание блокировки в SQLite - опрос с паузами
+# до 100 мс, поэтому запросы на запись выполняются по одному: короткая очередь ждет
+# в порядке поступления, сверх нее - 503. Пул основной БД (см. app/database.py) рассчитан на этот лимит.
+WRITE_CONCURRENCY = 1
+WRITE_QUEUE_LIMIT = 16  # запросов на запись, ожидающих своей очереди
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+BUCKET_IDLE_TTL = 600      # секунд бездействия, после которых корзина клиента удаляется
+BUCKET_PRUNE_SIZE = 10000  # число корзин, при превышении которого запускается очистка
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class _RouteState:
+    def __init__(self, limit: RouteLimit):
+        self.limit = limit
+        self.buckets = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.allowed = 0
+        self.rate_limited = 0
+        self.shed = 0
+
+    def take_token(self, client: str, now: float) -> Optional[float]:
+        """
+        Списывает токен клиента, возвращает время ожидания в секундах, если токенов нет
+        """
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            if len(self.buckets) >= BUCKET_PRUNE_SIZE:
+                self._prune(now)
+            bucket = self.buckets[client] = _Bucket(self.limit.burst, now)
+        else:
+            bucket.tokens = min(self.limit.burst, bucket.tokens + (now - bucket.updated) * self.limit.rate)
+            bucket.updated = now
+
+        if bucket.tokens < 1:
+            return (1 - bucket.tokens) / self.limit.rate
+        bucket.tokens -= 1
+        return None
+
+    def _prune(self, now: float):
+        stale = [client for client, bucket in self.buckets.items() if now - bucket.updated > BUCKET_IDLE_TTL]
+        for client in stale:
+            del self.buckets[client]
+
+    def stats(self) -> dict:
+        return {
+            "allowed": self.allowed,
+            "rate_limited": self.rate_limited,
+            "shed": self.shed,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "clients": len(self.buckets),
+        }
+
+
+class _WriteAdmission:
+    def __init__(self, concurrency: int, queue_limit: int):
+        self.concurrency = concurrency
+        self.queue_limit = queue_limit
+        self.slots = asyncio.Semaphore(concurrency)  # ожидающие пропускаются в порядке поступления
+        self.waiting = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.queued = 0
+        self.shed = 0
+
+    def full(self) -> bool:
+        return self.slots.locked() and self.waiting >= self.queue_limit
+
+    async def acquire(self):
+        if self.slots.locked():
+            self.queued += 1
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def release(self):
+        self.in_flight -= 1
+        self.slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "queued": self.queued,
+            "shed": self.shed,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+        }
+
+
+_states = {prefix: _RouteState(limit) for prefix, limit in RATE_LIMITS.items()}
+_writes = _WriteAdmission(WRITE_CONCURRENCY, WRITE_QUEUE_LIMIT)
+# Сначала длинные префиксы, чтобы /employees/login не попадал под /employees
+_prefixes = sorted(_states, key=len, reverse=True)
+
+
+def _route_state(path: str) -> Optional[_RouteState]:
+    for prefix in _prefixes:
+        if path == prefix or path.startswith(prefix + "/"):
+            return _states[prefix]
+    return None
+
+
+def _client_key(scope) -> str:
+    # Только IP-адрес: заголовок X-Employee-Id не проверяется, и со сменой его значения
+    # клиент получал бы новую корзину с полным запасом токенов
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+def get_stats() -> dict:
+    """
+    Счетчики лимитера по каждому префиксу и общего лимита записи для мониторинга
+    """
+    return {"routes": {prefix: state.stats() for prefix, state in _states.items()}, "writes": _writes.stats()}
+
+
+async def _reject(send, status: int, detail: str, retry_after: float):
+    body = json.dumps({"detail": detail}, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class RateLimitMiddleware:
+    """
+    Ограничение частоты (token bucket на IP-адрес клиента), числа одновременных запросов
+    на маршрут и общего числа одновременных запросов на запись
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        state = _route_state(scope["path"])
+        if state is None:
+            return await self.app(scope, receive, send)
+
+        # Сброс по перегрузке проверяем первым, чтобы он не расходовал токены клиента
+        if state.in_flight >= state.limit.concurrency:
+            state.shed += 1
+            return await _reject(send, 503, "Сервис перегружен, повторите позже", 1)
+        writes = scope["method"] in WRITE_METHODS
+        if writes and _writes.full():
+            _writes.shed += 1
+            return await _reject(send, 503, "Сервис перегружен, повторите позже", 1)
+
+        wait = state.take_token(_client_key(scope), time.monotonic())
+        if wait is not None:
+            state.rate_limited += 1
+            return await _reject(send, 429, "Слишком много запросов, повторите позже", wait)
+
+        state.allowed += 1
+        state.in_flight += 1
+        state.peak_in_flight = max(state.peak_in_flight, state.in_flight)
+        try:
+            if not writes:
+                return await self.app(scope, receive, send)
+            await _writes.acquire()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                _writes.release()
+        finally:
+            state.in_flight -= 1
@@ -0,0 +1,297 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import delete, exists, extract, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.future import select
+
+from app.database import engine, init_db
+from app.models import Action, Employee, Otdel, Post, OvertimeMonthly, IdempotencyKey
+from app.workcalendar import work_calendar
+
+
+logger = logging.getLogger(__name__)
+
+PURGE_RETENTION_DAYS = 90  # сколько дней хранятся мягко удаленные строки
+PURGE_BATCH_SIZE = 1000    # строк в одной транзакции очистки
+PURGE_INTERVAL = 3600      # секунд между запусками очистки
+
+OVERTIME_BATCH_SIZE = 1000   # строк, обрабатываемых за один проход
+OVERTIME_CACHE_SIZE = 10000  # результатов (сотрудник, период) в кэше
+OVERTIME_LOOKUP_CHUNK = 500  # id сотрудников в одном IN (...)
+
+
+async def _purge_table(model, primary_key, older_than: datetime, *conditions) -> int:
+    """
+    Окончательное удаление строк таблицы пакетами, каждая пачка в своей транзакции,
+    чтобы не держать блокировку записи SQLite надолго
+    """
+    purged = 0
+    while True:
+        batch = (
+            select(primary_key)
+            .where(model.deleted_at.is_not(None), model.deleted_at < older_than, *conditions)
+            .limit(PURGE_BATCH_SIZE)
+        )
+        async with engine.begin() as conn:
+            result = await conn.execute(delete(model.__table__).where(primary_key.in_(batch)))
+        purged += result.rowcount
+        if result.rowcount < PURGE_BATCH_SIZE:
+            return purged
+        await asyncio.sleep(0)
+
+
+async def purge_deleted(retention_days: int = PURGE_RETENTION_DAYS) -> dict:
+    """
+    Окончательное удаление мягко удаленных строк старше retention_days.
+    Порядок таблиц и условия NOT EXISTS не дают нарушить внешние ключи.
+    """
+    older_than = datetime.now() - timedelta(days=retention_days)
+    return {
+        "action": await _purge_table(Action, Action.action_id, older_than),
+        "employee": await _purge_table(
+            Employee, Employee.employee_id, older_than,
+            ~exists().where(Action.employee_id == Employee.employee_id)
+        ),
+        "otdel": await _purge_table(
+            Otdel, Otdel.otdel_id, older_than,
+            ~exists().where(Employee.otdel_id == Otdel.otdel_id)
+        ),
+        "post": await _purge_table(
+            Post, Post.post_id, older_than,
+            ~exists().where(Employee.post_id == Post.post_id)
+        ),
+    }
+
+
+async def purge_idempotency_keys() -> int:
+    """
+    Удаление сохраненных ответов Idempotency-Key с истекшим сроком
+    """
+    async with engine.begin() as conn:
+        result = await conn.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < datetime.now()))
+        return result.rowcount
+
+
+async def run_purge_job():
+    """
+    Фоновая задача периодической очистки удаленных строк и устаревших ключей идемпотентности
+    """
+    while True:
+        try:
+            purged = await purge_deleted()
+            purged["idempotency_key"] = await purge_idempotency_keys()
+            if any(purged.values()):
+                logger.info("Очистка удаленных строк: %s", purged)
+        except Exception:
+            logger.exception("Ошибка очистки удаленных строк")
+        await asyncio.sleep(PURGE_INTERVAL)
+
+
+async def update_overtime_rollup(db, actions, sign: int = 1):
+    """
+    Инкрементальное обновление помесячной сводки в транзакции сессии db.
+    actions - объекты или строки с employee_id, date_action, actiontype_id, hours;
+    sign=-1 вычитает действия (удаление).
+    """
+    totals = {}
+    for action in actions:
+        key = (action.employee_id, action.date_action.year, action.date_action.month, action.actiontype_id)
+        hours, count = totals.get(key, (0, 0))
+        totals[key] = (hours + sign * action.hours, count + sign)
+    if not totals:
+        return
+
+    table = OvertimeMonthly.__table__
+    statement = sqlite_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.employee_id, table.c.year, table.c.month, table.c.actiontype_id],
+        set_={
+            "hours": table.c.hours + statement.excluded.hours,
+            "actions_count": table.c.actions_count + statement.excluded.actions_count,
+        }
+    )
+    await db.execute(statement, [
+        {"employee_id": employee_id, "year": year, "month": month, "actiontype_id": actiontype_id,
+         "hours": hours, "actions_count": count}
+        for (employee_id, year, month, actiontype_id), (hours, count) in totals.items()
+    ])
+
+    if sign < 0:
+        # Месяцы, в которых не осталось действий, убираем из сводки
+        await db.execute(
+            delete(table).where(
+                table.c.actions_count <= 0,
+                table.c.employee_id.in_({employee_id for employee_id, _, _, _ in totals})
+            )
+        )
+
+
+async def remove_from_overtime_rollup(db, employee_ids):
+    """
+    Удаление сводки сотрудников, все действия которых удалены
+    """
+    table = OvertimeMonthly.__table__
+    await db.execute(delete(table).where(table.c.employee_id.in_(employee_ids)))
+
+
+async def rebuild_overtime_rollup() -> int:
+    """
+    Полное перестроение сводки из таблицы action одним групповым запросом
+    """
+    table = OvertimeMonthly.__table__
+    year = extract("year", Action.date_action)
+    month = extract("month", Action.date_action)
+    grouped = (
+        select(
+            Action.employee_id,
+            year,
+            month,
+            Action.actiontype_id,
+            func.sum(Action.hours),
+            func.count()
+        )
+        .where(Action.deleted_at.is_(None))
+        .group_by(Action.employee_id, year, month, Action.actiontype_id)
+    )
+    async with engine.begin() as conn:
+        await conn.execute(delete(table))
+        await conn.execute(table.insert().from_select(
+            ["employee_id", "year", "month", "actiontype_id", "hours", "actions_count"], grouped
+        ))
+        result = await conn.execute(select(func.count()).select_from(table))
+        return result.scalar()
+
+
+async def ensure_overtime_rollup():
+    """
+    Заполнение сводки при первом запуске на базе, где уже есть действия
+    """
+    async with engine.connect() as conn:
+        has_rollup = (await conn.execute(select(exists().select_from(OvertimeMonthly.__table__)))).scalar()
+        has_actions = (await conn.execute(select(exists().where(Action.deleted_at.is_(None))))).scalar()
+    if has_actions and not has_rollup:
+        await rebuild_overtime_rollup()
+
+
+# (employee_id, date_from, date_to) -> (поколение, результат)
+_overtime_cache = OrderedDict()
+# employee_id -> поколение, увеличивается при изменении действий сотрудника
+_overtime_generations = {}
+# Общее поколение, увеличивается при сбросе кэша для всех сотрудников
+_overtime_global_generation = 0
+
+
+def invalidate_overtime_cache(employee_ids=None):
+    """
+    Сброс кэша расчета для сотрудников, без аргумента - полностью.
+    Сброс идет через поколения, чтобы расчет, начатый до сброса, не вернул в кэш устаревший результат.
+    """
+    global _overtime_global_generation
+    if employee_ids is None:
+        _overtime_global_generation += 1
+        _overtime_cache.clear()
+        return
+    for employee_id in employee_ids:
+        _overtime_generations[employee_id] = _overtime_generations.get(employee_id, 0) + 1
+
+
+def refresh_work_calendar():
+    """
+    Перечитывает измененные файлы календаря и коэффициентов. Кэш расчета при этом
+    сбрасывается: в нем уже применены прежние классы дней и коэффициенты.
+    """
+    if work_calendar.refresh():
+        invalidate_overtime_cache()
+
+
+def _empty_overtime(employee_id: int, date_from: date, date_to: date) -> dict:
+    return {
+        "employee_id": employee_id,
+        "date_from": date_from,
+        "date_to": date_to,
+        "hours": 0,
+        "weighted_hours": 0.0,
+        "items": [],
+    }
+
+
+async def compute_overtime(db, employee_ids, date_from: date, date_to: date) -> dict:
+    """
+    Расчет часов с коэффициентами по классу дня (рабочий/выходной/праздник).
+    Часы суммируются в БД по (сотрудник, дата, тип), затем каждая пачка строк
+    классифицируется по календарю: каждая дата - один раз на пачку.
+    Возвращает {employee_id: результат}; результаты кэшируются по (сотрудник, период).
+    """
+    refresh_work_calendar()
+    results, missing, generations = {}, [], {}
+    for employee_id in employee_ids:
+        generation = (_overtime_global_generation, _overtime_generations.get(employee_id, 0))
+        cached = _overtime_cache.get((employee_id, date_from, date_to))
+        if cached is not None and cached[0] == generation:
+            _overtime_cache.move_to_end((employee_id, date_from, date_to))
+            results[employee_id] = cached[1]
+        else:
+            missing.append(employee_id)
+            generations[employee_id] = generation
+
+    # (employee_id, actiontype_id, класс дня) -> часы
+    totals = {}
+    for start in range(0, len(missing), OVERTIME_LOOKUP_CHUNK):
+        query = (
+            select(Action.employee_id, Action.date_action, Action.actiontype_id, func.sum(Action.hours))
+            .where(
+                Action.employee_id.in_(missing[start:start + OVERTIME_LOOKUP_CHUNK]),
+                Action.deleted_at.is_(None),
+                Action.date_action >= date_from,
+                Action.date_action <= date_to
+            )
+            .group_by(Action.employee_id, Action.date_action, Action.actiontype_id)
+            .execution_options(yield_per=OVERTIME_BATCH_SIZE)
+        )
+        result = await db.stream(query)
+        async for rows in result.partitions():
+            day_classes = {day: work_calendar.day_class(day) for day in {row[1] for row in rows}}
+            for employee_id, day, actiontype_id, hours in rows:
+                key = (employee_id, actiontype_id, day_classes[day])
+                totals[key] = totals.get(key, 0) + hours
+
+    computed = {employee_id: _empty_overtime(employee_id, date_from, date_to) for employee_id in missing}
+    for (employee_id, actiontype_id, day_class), hours in sorted(totals.items()):
+        multiplier = work_calendar.multiplier(actiontype_id, day_class)
+        summary = computed[employee_id]
+        summary["hours"] += hours
+        summary["weighted_hours"] += hours * multiplier
+        summary["items"].append({
+            "actiontype_id": actiontype_id,
+            "day_class": day_class,
+            "hours": hours,
+            "multiplier": multiplier,
+            "weighted_hours": hours * multiplier,
+        })
+
+    for employee_id, summary in computed.items():
+        _overtime_cache[(employee_id, date_from, date_to)] = (generations[employee_id], summary)
+        results[employee_id] = summary
+    while len(_overtime_cache) > OVERTIME_CACHE_SIZE:
+        _overtime_cache.popitem(last=False)
+
+    return results
+
+
+async def _run_command(command: str):
+    await init_db()
+    if command == "rebuild-rollup":
+        print(f"Сводка перестроена, строк: {await rebuild_overtime_rollup()}")
+    else:
+        print(f"Удалено строк: {await purge_deleted()}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Служебные команды Employee Overtime API")
+    parser.add_argument("command", choices=["rebuild-rollup", "purge"])
+    asyncio.run(_run_command(parser.parse_args().command))
@@ -0,0 +1,344 @@
+"""
+Нагрузочная проверка корректности остатков часов.
+
+Запускает приложение в процессе на временной БД SQLite и выполняет случайную
+параллельную смесь запросов /actions/create, DELETE /actions/{id} и
+PUT /employees/{id}/add-hours, затем проверяет инварианты и выводит пропускную способность:
+
+    python -m app.stress --operations 5000 --concurrency 64 --seed 1
+
+Список операций строится из seed до запуска, поэтому прогон с тем же seed
+повторяет те же запросы (различается только их чередование во времени).
+Код возврата 1, если хотя бы один инвариант нарушен.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+
+STRESS_EMPLOYEES = 20      # сотрудников в тестовой БД
+STRESS_OPERATIONS = 2000   # запросов за прогон
+STRESS_CONCURRENCY = 32    # одновременных запросов
+
+# Доли операций в смеси
+WEIGHT_CREATE = 5
+WEIGHT_DELETE = 2
+WEIGHT_ADD_HOURS = 3
+
+DUPLICATE_DELETE_RATE = 0.1  # доля удалений уже удаляемого действия (гонка повторного удаления)
+CLIENT_PAUSE = 0.02          # средняя пауза (с) клиента перед запросом и перед повтором после 503
+
+
+async def _call(app, method: str, path: str, payload=None, employee_id: int = None):
+    """
+    Вызов ASGI-приложения без сетевого уровня, возвращает (статус, JSON-ответ)
+    """
+    body = json.dumps(payload).encode() if payload is not None else b""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"stress"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("stress", 80),
+    }
+    if employee_id is not None:
+        scope["headers"].append((b"x-employee-id", str(employee_id).encode()))
+    request_sent = False
+    response = {"status": None, "body": []}
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"].append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    raw = b"".join(response["body"])
+    try:
+        data = json.loads(raw) if raw else None
+    except ValueError:
+        data = raw.decode("utf-8", "replace")
+    return response["status"], data
+
+
+class _Ledger:
+    """
+    Ожидаемое состояние по подтвержденным (2xx) ответам
+    """
+
+    def __init__(self):
+        self.initial = {}                  # employee_id -> остаток при создании
+        self.balances = {}                 # employee_id -> ожидаемый остаток
+        self.add_hours = defaultdict(int)  # employee_id -> сумма начислений add-hours
+        self.actions = {}                  # action_id -> (employee_id, hours) активных действий
+        self.deleted = Counter()           # action_id -> число успешных удалений
+
+
+async def _seed(app, ledger: _Ledger, employees: int):
+    status, otdel = await _call(app, "POST", "/otdels/create", {"name_otdel": "stress"})
+    assert status == 200, otdel
+    status, post = await _call(app, "POST", "/posts/create", {"name_post": "stress"})
+    assert status == 200, post
+    for number in range(employees):
+        status, employee = await _call(app, "POST", "/employees/create", {
+            "surname": "Нагрузка", "name": str(number), "patronymic": "-",
+            "login": f"stress{number}", "password": "stress",
+            "otdel_id": otdel["otdel_id"], "post_id": post["post_id"], "role_id": 2
+        })
+        assert status == 200, employee
+        ledger.initial[employee["employee_id"]] = employee["idle_hours"]
+        ledger.balances[employee["employee_id"]] = employee["idle_hours"]
+
+
+def _plan_operations(rng: random.Random, count: int, employee_ids: list) -> list:
+    """
+    Список операций, полностью определяемый seed: прогон с тем же seed повторяет те же запросы.
+    Удаление ссылается на номер операции создания в списке - id действия зависит от порядка,
+    в котором завершаются параллельные запросы.
+    """
+    operations, creates, deleting = [], [], set()
+    for index in range(count):
+        kind = rng.choices(["create", "delete", "add_hours"], [WEIGHT_CREATE, WEIGHT_DELETE, WEIGHT_ADD_HOURS])[0]
+        if kind == "delete":
+            if deleting and rng.random() < DUPLICATE_DELETE_RATE:
+                operations.append((index, "delete", rng.choice(sorted(deleting))))
+                continue
+            candidates = [create for create in creates if create not in deleting]
+            if candidates:
+                create = rng.choice(candidates)
+                deleting.add(create)
+                operations.append((index, "delete", create))
+                continue
+            kind = "create"
+        if kind == "create":
+            creates.append(index)
+            operations.append((index, "create", {
+                "hours": rng.randint(1, 8),
+                "date_action": (date(2025, 1, 1) + timedelta(days=rng.randrange(365))).isoformat(),
+                "employee_id": rng.choice(employee_ids),
+                "actiontype_id": rng.choice([1, 2]),
+            }))
+        else:
+            operations.append((index, "add_hours", (rng.choice(employee_ids), rng.randint(-8, 8))))
+    return operations
+
+
+async def _call_admitted(app, statuses: Counter, kind: str, *args, **kwargs):
+    """
+    Запрос с повтором после 503: так поступает клиент, получивший отказ лимитера.
+    Пауза перед каждой попыткой случайная и одинаковая для новых запросов и повторов:
+    иначе освободившееся место сразу занимает следующий запрос того же клиента,
+    а повторы остальных не проходят до конца прогона.
+    """
+    while True:
+        await asyncio.sleep(random.uniform(0, 2 * CLIENT_PAUSE))
+        status, data = await _call(app, *args, **kwargs)
+        if status != 503:
+            return status, data
+        statuses[(kind, 503)] += 1
+
+
+async def _run_operation(app, operation, created: dict, ledger: _Ledger, statuses: Counter, latencies: dict,
+                         errors: list):
+    index, kind, argument = operation
+    if kind == "delete":
+        # Создание уже взято в работу (оно раньше в списке) - ждем его id
+        argument = await created[argument]
+        if argument is None:
+            return  # создание не удалось, ошибка уже учтена
+    started = time.perf_counter()
+    if kind == "create":
+        status, data = await _call_admitted(app, statuses, kind, "POST", "/actions/create", argument,
+                                            employee_id=argument["employee_id"])
+        created[index].set_result(data["action_id"] if status == 200 else None)
+        if status == 200:
+            ledger.actions[data["action_id"]] = (argument["employee_id"], argument["hours"])
+            ledger.balances[argument["employee_id"]] += argument["hours"]
+    elif kind == "delete":
+        status, data = await _call_admitted(app, statuses, kind, "DELETE", f"/actions/{argument}")
+        if status == 200:
+            ledger.deleted[argument] += 1
+            if argument in ledger.actions:
+                employee_id, hours = ledger.actions.pop(argument)
+                ledger.balances[employee_id] -= hours
+    else:
+        employee_id, hours = argument
+        status, data = await _call_admitted(app, statuses, kind, "PUT", f"/employees/{employee_id}/add-hours",
+                                            {"idle_hours": hours}, employee_id=employee_id)
+        if status == 200:
+            ledger.add_hours[employee_id] += hours
+            ledger.balances[employee_id] += hours
+
+    latencies[kind].append(time.perf_counter() - started)
+    statuses[(kind, status)] += 1
+    if status is None or status >= 500 or (kind != "delete" and status != 200):
+        errors.append(f"{kind} {argument}: {status} {data}")
+
+
+async def _check_invariants(ledger: _Ledger) -> list:
+    from sqlalchemy import func
+    from sqlalchemy.future import select
+    from app.database import engine
+    from app.models import Action, Employee, OvertimeMonthly
+
+    failures = []
+    async with engine.connect() as conn:
+        balances = dict((await conn.execute(select(Employee.employee_id, Employee.idle_hours))).all())
+        active = dict((await conn.execute(
+            select(Action.employee_id, func.sum(Action.hours))
+            .where(Action.deleted_at.is_(None))
+            .group_by(Action.employee_id)
+        )).all())
+        active_ids = set((await conn.execute(select(Action.action_id).where(Action.deleted_at.is_(None)))).scalars())
+        orphans = (await conn.execute(
+            select(func.count())
+            .select_from(Action)
+            .outerjoin(Employee, Action.employee_id == Employee.employee_id)
+            .where(Action.deleted_at.is_(None), (Employee.employee_id.is_(None)) | (Employee.deleted_at.is_not(None)))
+        )).scalar_one()
+        expected_rollup = set((await conn.execute(
+            select(Action.employee_id, func.strftime("%Y", Action.date_action), func.strftime("%m", Action.date_action),
+                   Action.actiontype_id, func.sum(Action.hours), func.count())
+            .where(Action.deleted_at.is_(None))
+            .group_by(Action.employee_id, Action.actiontype_id,
+                      func.strftime("%Y", Action.date_action), func.strftime("%m", Action.date_action))
+        )).all())
+        rollup = set((await conn.execute(
+            select(OvertimeMonthly.employee_id, OvertimeMonthly.year, OvertimeMonthly.month,
+                   OvertimeMonthly.actiontype_id, OvertimeMonthly.hours, OvertimeMonthly.actions_count)
+            .where(OvertimeMonthly.actions_count > 0)
+        )).all())
+
+    for employee_id, expected in ledger.balances.items():
+        # Потерянное обновление: остаток в БД расходится с подтвержденными клиенту ответами
+        if balances.get(employee_id) != expected:
+            failures.append(f"сотрудник {employee_id}: остаток {balances.get(employee_id)}, ожидался {expected}")
+        # Остаток равен сумме начислений и часов активных действий
+        from_deltas = ledger.initial[employee_id] + ledger.add_hours[employee_id] + active.get(employee_id, 0)
+        if balances.get(employee_id) != from_deltas:
+            failures.append(f"сотрудник {employee_id}: остаток {balances.get(employee_id)}, сумма изменений {from_deltas}")
+
+    if active_ids != set(ledger.actions):
+        failures.append(f"активные действия расходятся с подтвержденными: "
+                        f"лишние {sorted(active_ids - set(ledger.actions))[:10]}, "
+                        f"потерянные {sorted(set(ledger.actions) - active_ids)[:10]}")
+    twice = [action_id for action_id, count in ledger.deleted.items() if count > 1]
+    if twice:
+        failures.append(f"действия удалены успешно более одного раза: {twice[:10]}")
+    if orphans:
+        failures.append(f"активных действий без активного сотрудника: {orphans}")
+
+    expected_rollup = {(row[0], int(row[1]), int(row[2]), *row[3:]) for row in expected_rollup}
+    if rollup != expected_rollup:
+        failures.append(f"помесячная сводка расходится с действиями: {len(rollup ^ expected_rollup)} строк")
+    return failures
+
+
+def _percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000 if ordered else 0.0
+
+
+async def run(operations: int, concurrency: int, employees: int, seed: int) -> int:
+    import main
+    from app import ratelimit
+
+    # Проверяется корректность под нагрузкой, а не лимитер - снимаем ограничения маршрутов.
+    # Общий лимит записи остается: пул основной БД рассчитан на него, сброшенные запросы повторяются.
+    for state in ratelimit._states.values():
+        state.limit = ratelimit.RouteLimit(rate=float("inf"), burst=sys.maxsize, concurrency=sys.maxsize)
+
+    rng = random.Random(seed)
+    ledger = _Ledger()
+    statuses = Counter()
+    latencies = defaultdict(list)
+    errors = []
+
+    async with main.lifespan(main.app):
+        await _seed(main.app, ledger, employees)
+        employee_ids = sorted(ledger.balances)
+
+        plan = _plan_operations(rng, operations, employee_ids)
+        loop = asyncio.get_running_loop()
+        created = {index: loop.create_future() for index, kind, _ in plan if kind == "create"}
+        queue = asyncio.Queue()
+        for operation in plan:
+            queue.put_nowait(operation)
+
+        async def worker():
+            while not queue.empty():
+                await _run_operation(main.app, queue.get_nowait(), created, ledger, statuses, latencies, errors)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+        failures = await _check_invariants(ledger)
+
+    print(f"Запросов: {operations}, параллельно: {concurrency}, сотрудников: {employees}, seed: {seed}")
+    print(f"Время: {elapsed:.2f} с, пропускная способность: {operations / elapsed:.1f} запросов/с")
+    for kind in sorted(latencies):
+        values = latencies[kind]
+        print(f"  {kind:<10} {len(values):>6}  p50 {_percentile(values, 0.5):7.1f} мс  "
+              f"p95 {_percentile(values, 0.95):7.1f} мс  p99 {_percentile(values, 0.99):7.1f} мс")
+    print("Статусы: " + ", ".join(f"{kind} {status}: {count}" for (kind, status), count in sorted(statuses.items(), key=str)))
+
+    for error in errors[:10]:
+        print(f"Ошибка: {error}")
+    if failures or errors:
+        for failure in failures:
+            print(f"НАРУШЕН ИНВАРИАНТ: {failure}")
+        return 1
+    print("Инварианты выполнены")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочная проверка корректности остатков часов")
+    parser.add_argument("--operations", type=int, default=STRESS_OPERATIONS)
+    parser.add_argument("--concurrency", type=int, default=STRESS_CONCURRENCY)
+    parser.add_argument("--employees", type=int, default=STRESS_EMPLOYEES)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+
+    # БД и настройки задаются до импорта приложения: движки создаются при импорте app.database
+    directory = tempfile.mkdtemp(prefix="overtime_stress_")
+    path = os.path.join(directory, "stress.db")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{path}"
+    os.environ["READ_DATABASE_URL"] = f"sqlite+aiosqlite:///file:{path}?mode=ro&uri=true"
+    os.environ.setdefault("ACCESS_LOG_SAMPLE_RATE", "0")
+    try:
+        sys.exit(asyncio.run(run(args.operations, args.concurrency, args.employees, seed)))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
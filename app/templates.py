@@ -0,0 +1,246 @@
+import html
+import logging
+import os
+import re
+from datetime import date, datetime
+from typing import Iterator, Optional
+
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = os.getenv("TEMPLATE_DIR", "templates")  # файлы вида timesheet.html, timesheet.rtf
+RENDER_CHUNK = 256  # фрагментов, собираемых в одну порцию потокового ответа
+
+
+class TemplateError(ValueError):
+    pass
+
+
+def html_escape(value: str) -> str:
+    return html.escape(value, quote=True)
+
+
+def rtf_unicode(text: str) -> str:
+    """
+    Не-ASCII символы в виде \\uN? (RTF хранит текст в 7-битной кодировке)
+    """
+    if text.isascii():
+        return text
+    return "".join(
+        char if ord(char) < 128 else f"\\u{ord(char) - 65536 if ord(char) > 32767 else ord(char)}?"
+        for char in text
+    )
+
+
+def rtf_escape(value: str) -> str:
+    value = value.replace("\\", "\\\\").replace("{", "\\{").replace("}", "\\}").replace("\n", "\\line ")
+    return rtf_unicode(value)
+
+
+# Формат ответа -> (расширение файла шаблона, тип содержимого, экранирование значений)
+FORMATS = {
+    "doc": (".html", "application/msword", html_escape),
+    "rtf": (".rtf", "application/rtf", rtf_escape),
+}
+
+
+def _format_value(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%d.%m.%Y")
+    if isinstance(value, float):
+        return f"{value:g}"
+    return str(value)
+
+
+class _Var:
+    """
+    Подстановка {{ name }} или {{ row.field }}: поля берутся атрибутом (строки запроса, модели) или ключом
+    """
+    __slots__ = ("name", "path")
+
+    def __init__(self, expression: str):
+        self.name, *self.path = expression.split(".")
+
+    def resolve(self, scope: dict):
+        try:
+            value = scope[self.name]
+        except KeyError:
+            raise TemplateError(f"Не передано значение {self.name}")
+        for part in self.path:
+            value = value[part] if isinstance(value, dict) else getattr(value, part)
+        return value
+
+
+class _Loop:
+    """
+    Блок {% for row in rows %} ... {% endfor %}
+    """
+    __slots__ = ("target", "source", "body")
+
+    def __init__(self, target: str, source: str):
+        self.target = target
+        self.source = _Var(source)
+        self.body = []
+
+
+_TOKEN = re.compile(
+    r"\{\{\s*(?P<var>[\w.]+)\s*\}\}"
+    r"|\{%\s*for\s+(?P<target>\w+)\s+in\s+(?P<source>[\w.]+)\s*%\}"
+    r"|\{%\s*(?P<end>endfor)\s*%\}"
+)
+
+
+class Template:
+    """
+    Шаблон, один раз разобранный в список узлов: строки текста, подстановки и циклы.
+    Отрисовка выдает документ порциями, без склеивания всего текста в одну строку.
+    """
+
+    def __init__(self, name: str, source: str, escape, literal=None):
+        self.name = name
+        self.escape = escape
+        self.nodes = self._compile(source, literal or (lambda text: text))
+
+    @staticmethod
+    def _compile(source: str, literal) -> list:
+        root = []
+        stack = [root]
+        position = 0
+        for match in _TOKEN.finditer(source):
+            if match.start() > position:
+                stack[-1].append(literal(source[position:match.start()]))
+            if match.group("var"):
+                stack[-1].append(_Var(match.group("var")))
+            elif match.group("target"):
+                loop = _Loop(match.group("target"), match.group("source"))
+                stack[-1].append(loop)
+                stack.append(loop.body)
+            else:
+                if len(stack) == 1:
+                    raise TemplateError("Лишний {% endfor %}")
+                stack.pop()
+            position = match.end()
+        if len(stack) > 1:
+            raise TemplateError("Не закрыт блок {% for %}")
+        if position < len(source):
+            root.append(literal(source[position:]))
+        return root
+
+    def _render(self, nodes: list, scope: dict, buffer: list) -> Iterator[str]:
+        escape = self.escape
+        for node in nodes:
+            if node.__class__ is str:
+                buffer.append(node)
+            elif node.__class__ is _Var:
+                buffer.append(escape(_format_value(node.resolve(scope))))
+            else:
+                for item in node.source.resolve(scope):
+                    scope[node.target] = item
+                    yield from self._render(node.body, scope, buffer)
+                    if len(buffer) >= RENDER_CHUNK:
+                        yield "".join(buffer)
+                        buffer.clear()
+
+    def _check(self, nodes: list, scope: dict):
+        for node in nodes:
+            if node.__class__ is _Var:
+                node.resolve(scope)
+            elif node.__class__ is _Loop:
+                for item in node.source.resolve(scope):
+                    scope[node.target] = item
+                    self._check(node.body, scope)
+                    break
+
+    def check(self, context: dict):
+        """
+        Проверка, что все подстановки разрешаются в данных, без отрисовки. Тело цикла
+        проверяется на первом элементе: строки одной выборки имеют одинаковые поля.
+        Ошибки те же, что при отрисовке: TemplateError, AttributeError, KeyError, TypeError.
+        """
+        self._check(self.nodes, dict(context))
+
+    def render(self, context: dict) -> Iterator[str]:
+        """
+        Документ порциями по RENDER_CHUNK фрагментов
+        """
+        buffer = []
+        yield from self._render(self.nodes, dict(context), buffer)
+        if buffer:
+            yield "".join(buffer)
+
+
+class _Entry:
+    __slots__ = ("path", "mtime", "template")
+
+    def __init__(self, path: str, mtime: float, template: Template):
+        self.path = path
+        self.mtime = mtime
+        self.template = template
+
+
+class TemplateRegistry:
+    """
+    Шаблоны документов из TEMPLATE_DIR, разобранные при запуске.
+    При изменении файла (mtime) шаблон перечитывается при следующем обращении;
+    если новая версия с ошибкой, продолжает использоваться прежняя.
+    """
+
+    def __init__(self, directory: str = TEMPLATE_DIR):
+        self.directory = directory
+        self._entries = {}
+
+    def load(self):
+        if not os.path.isdir(self.directory):
+            logger.warning("Каталог шаблонов %s не найден", self.directory)
+            return
+        for filename in sorted(os.listdir(self.directory)):
+            name, extension = os.path.splitext(filename)
+            for document_format, (format_extension, _, _) in FORMATS.items():
+                if extension == format_extension:
+                    try:
+                        self.get(name, document_format)
+                    except TemplateError:
+                        logger.exception("Ошибка в шаблоне %s", filename)
+
+    def names(self) -> dict:
+        """
+        Загруженные шаблоны и доступные для них форматы
+        """
+        names = {}
+        for name, document_format in sorted(self._entries):
+            names.setdefault(name, []).append(document_format)
+        return names
+
+    def get(self, name: str, document_format: str) -> Optional[Template]:
+        extension, _, escape = FORMATS[document_format]
+        key = (name, document_format)
+        entry = self._entries.get(key)
+        path = os.path.join(self.directory, name + extension)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            self._entries.pop(key, None)
+            return None
+
+        if entry is not None and entry.mtime == mtime:
+            return entry.template
+
+        try:
+            with open(path, encoding="utf-8") as f:
+                source = f.read()
+            literal = rtf_unicode if document_format == "rtf" else None
+            template = Template(name, source, escape, literal)
+        except (OSError, UnicodeDecodeError, TemplateError):
+            if entry is None:
+                raise TemplateError(f"Не удалось загрузить шаблон {name}{extension}")
+            logger.exception("Шаблон %s не перезагружен, используется прежняя версия", path)
+            entry.mtime = mtime
+            return entry.template
+
+        self._entries[key] = _Entry(path, mtime, template)
+        return template
+
+
+template_registry = TemplateRegistry()
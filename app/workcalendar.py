@@ -0,0 +1,160 @@
+import json
+import os
+from datetime import date
+from typing import Iterable, Optional
+
+
+CALENDAR_DIR = os.getenv("CALENDAR_DIR", "calendars")  # файлы вида 2025.json
+MULTIPLIERS_FILE = "multipliers.json"  # коэффициенты учета часов в CALENDAR_DIR
+
+# Классы дней
+WORKING = "working"
+WEEKEND = "weekend"
+HOLIDAY = "holiday"
+
+
+def _set_bit(bitmap: bytearray, index: int):
+    bitmap[index >> 3] |= 1 << (index & 7)
+
+
+def _clear_bit(bitmap: bytearray, index: int):
+    bitmap[index >> 3] &= ~(1 << (index & 7))
+
+
+def _get_bit(bitmap: bytearray, index: int) -> bool:
+    return bool(bitmap[index >> 3] >> (index & 7) & 1)
+
+
+class YearCalendar:
+    """
+    Производственный календарь года: два битовых массива по дню года
+    (нерабочие дни и праздники), 46 байт каждый
+    """
+    __slots__ = ("year", "_first_ordinal", "_days_off", "_holidays")
+
+    def __init__(self, year: int, holidays: Iterable[date] = (), days_off: Iterable[date] = (),
+                 workdays: Iterable[date] = ()):
+        self.year = year
+        self._first_ordinal = date(year, 1, 1).toordinal()
+        size = (date(year, 12, 31).toordinal() - self._first_ordinal) // 8 + 1
+        self._days_off = bytearray(size)
+        self._holidays = bytearray(size)
+
+        # По умолчанию нерабочие - суббота и воскресенье
+        for ordinal in range(self._first_ordinal, date(year, 12, 31).toordinal() + 1):
+            if date.fromordinal(ordinal).weekday() >= 5:
+                _set_bit(self._days_off, ordinal - self._first_ordinal)
+
+        # Переносы: дополнительные выходные и рабочие субботы
+        for day in days_off:
+            _set_bit(self._days_off, self._index(day))
+        for day in workdays:
+            _clear_bit(self._days_off, self._index(day))
+        for day in holidays:
+            _set_bit(self._days_off, self._index(day))
+            _set_bit(self._holidays, self._index(day))
+
+    def _index(self, day: date) -> int:
+        if day.year != self.year:
+            raise ValueError(f"Дата {day} не относится к {self.year} году")
+        return day.toordinal() - self._first_ordinal
+
+    def day_class(self, day: date) -> str:
+        index = day.toordinal() - self._first_ordinal
+        if _get_bit(self._holidays, index):
+            return HOLIDAY
+        if _get_bit(self._days_off, index):
+            return WEEKEND
+        return WORKING
+
+    @classmethod
+    def from_file(cls, path: str) -> "YearCalendar":
+        """
+        Загрузка из JSON: {"year": 2025, "holidays": [...], "days_off": [...], "workdays": [...]}
+        """
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+
+        def dates(key):
+            return [date.fromisoformat(value) for value in data.get(key, [])]
+
+        return cls(int(data["year"]), dates("holidays"), dates("days_off"), dates("workdays"))
+
+
+def load_multipliers(path: str) -> dict:
+    """
+    Коэффициенты из JSON: {"2": {"working": 1.5, "weekend": 2.0, "holiday": 2.0}} -
+    по id типа действия и классу дня. Для типов и классов без настройки коэффициент равен 1.
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+
+    multipliers = {}
+    for actiontype_id, classes in data.items():
+        unknown = set(classes) - {WORKING, WEEKEND, HOLIDAY}
+        if unknown:
+            raise ValueError(f"Неизвестные классы дней в {path}: {', '.join(sorted(unknown))}")
+        multipliers[int(actiontype_id)] = {day_class: float(value) for day_class, value in classes.items()}
+    return multipliers
+
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class WorkCalendar:
+    """
+    Календари по годам и коэффициенты учета часов, загружаемые из CALENDAR_DIR при первом обращении.
+    Для года без файла используются только обычные выходные.
+    """
+
+    def __init__(self, directory: str = CALENDAR_DIR):
+        self.directory = directory
+        self._years = {}
+        self._multipliers = None
+        self._mtimes = {}  # путь -> mtime при загрузке (None - файла не было)
+
+    def year(self, year: int) -> YearCalendar:
+        calendar = self._years.get(year)
+        if calendar is None:
+            path = os.path.join(self.directory, f"{year}.json")
+            mtime = _mtime(path)
+            calendar = YearCalendar.from_file(path) if mtime is not None else YearCalendar(year)
+            self._years[year] = calendar
+            self._mtimes[path] = mtime
+        return calendar
+
+    def day_class(self, day: date) -> str:
+        return self.year(day.year).day_class(day)
+
+    def multipliers(self) -> dict:
+        if self._multipliers is None:
+            path = os.path.join(self.directory, MULTIPLIERS_FILE)
+            mtime = _mtime(path)
+            self._multipliers = load_multipliers(path) if mtime is not None else {}
+            self._mtimes[path] = mtime
+        return self._multipliers
+
+    def multiplier(self, actiontype_id: int, day_class: str) -> float:
+        return self.multipliers().get(actiontype_id, {}).get(day_class, 1.0)
+
+    def refresh(self) -> bool:
+        """
+        Сбрасывает загруженное, если файлы изменились, появились или удалены с момента загрузки;
+        перечитываются они при следующем обращении. Возвращает True, если был сброс.
+        """
+        if all(_mtime(path) == mtime for path, mtime in self._mtimes.items()):
+            return False
+        self.reload()
+        return True
+
+    def reload(self):
+        self._years.clear()
+        self._multipliers = None
+        self._mtimes.clear()
+
+
+work_calendar = WorkCalendar()
@@ -1,18 +1,40 @@
 from fastapi import FastAPI, Depends
+from fastapi.middleware.gzip import GZipMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import init_db, get_session
-from app.api import otdel, post, employee, action, document
-from contextlib import asynccontextmanager
+from app.api import otdel, post, employee, action, document, export, overtime, sync, audit as audit_api
+from app.audit import audit_writer
+from app.context import request_context_middleware
+from app import ratelimit
+from app.idempotency import IdempotencyMiddleware
+from app.logs import AccessLogMiddleware, setup_logging, shutdown_logging
+from app.templates import template_registry
+from app.services import run_purge_job, ensure_overtime_rollup
+from contextlib import asynccontextmanager, suppress
+import asyncio
+import logging
 
 from app.models import Employee
 
+logger = logging.getLogger("app.main")
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    setup_logging()
     await init_db()
-    print("База данных собрана")
+    await ensure_overtime_rollup()
+    template_registry.load()
+    logger.info("База данных собрана")
+    audit_writer.start()
+    purge_task = asyncio.create_task(run_purge_job())
     yield
-    print("Приложение отключено...")
+    purge_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await purge_task
+    await audit_writer.stop()
+    logger.info("Приложение отключено...")
+    shutdown_logging()
 
 app = FastAPI(
     title="Employee Overtime API",
@@ -21,12 +43,24 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+app.middleware("http")(request_context_middleware)
+app.add_middleware(IdempotencyMiddleware)
+app.add_middleware(ratelimit.RateLimitMiddleware)
+# Сжатие снаружи идемпотентности: сохраненные ответы не зависят от Accept-Encoding клиента
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+# Журнал доступа снаружи всех, чтобы в него попадали и отказы лимитера
+app.add_middleware(AccessLogMiddleware)
+
 # Подключаем роутеры
 app.include_router(otdel.router)
 app.include_router(post.router)
 app.include_router(employee.router)
 app.include_router(action.router)
 app.include_router(document.router)
+app.include_router(export.router)
+app.include_router(overtime.router)
+app.include_router(sync.router)
+app.include_router(audit_api.router)
 
 @app.get("/")
 async def root():
@@ -36,6 +70,10 @@ async def root():
 async def health_check():
     return {"status": "работает"}
 
+@app.get("/health/limits")
+async def limits_stats():
+    return ratelimit.get_stats()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file